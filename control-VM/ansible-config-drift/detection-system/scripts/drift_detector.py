@@ -6,14 +6,19 @@ Detects configuration changes and generates reports.
 
 import os
 import sys
+import argparse
 import json
-import hashlib
+import io
+import fnmatch
+import pickle
+import re
+import functools
 import logging
-import yaml
+import mmap
+import multiprocessing
 from datetime import datetime, timedelta
 from pathlib import Path
-import subprocess
-import jsondiff
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # Setup logging
 logging.basicConfig(
@@ -26,18 +31,140 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Read size for the streaming checksum fallback (256 KB)
+CHECKSUM_BUFFER_SIZE = io.DEFAULT_BUFFER_SIZE * 32
+
+# Files above this size are hashed through mmap instead of read() (1 MB)
+CHECKSUM_MMAP_THRESHOLD = 1 << 20
+
+# Hashing workers are started by a fork server: the pool is created while
+# the other checks' threads run, and forking then can deadlock on locks
+# those threads hold
+_MP_CONTEXT = multiprocessing.get_context("forkserver")
+
+# Detection categories in report order, one per check in run_detection()
+DETECTION_CATEGORIES = ("file_integrity", "service_health", "package_management", "user_management")
+
+def _json_default(obj):
+    """Encode raw checksum digests as hex in JSON output."""
+    if isinstance(obj, bytes):
+        return obj.hex()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+@functools.lru_cache(maxsize=None)
+def _load_orjson():
+    """Import orjson on first use; None when it is not installed."""
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+def write_json(path, data, indent=False):
+    """Write data to path as JSON, using orjson when it is installed.
+    
+    orjson encodes into a single bytes buffer in C. The stdlib fallback
+    streams chunks from iterencode so no full-size str is ever built.
+    """
+    orjson = _load_orjson()
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, default=_json_default, option=orjson.OPT_INDENT_2 if indent else 0))
+        return
+    
+    encoder = json.JSONEncoder(default=_json_default, indent=2 if indent else None)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(encoder.iterencode(data))
+
+def json_loads(data):
+    """Parse JSON bytes, using orjson when it is installed."""
+    orjson = _load_orjson()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Critical paths
+CRITICAL_PATHS = (
+    '/etc/passwd', '/etc/shadow', '/etc/sudoers',
+    '/etc/ssh/sshd_config', '/root/', '/etc/cron'
+)
+
+# High importance paths
+HIGH_PATHS = (
+    '/etc/nginx/', '/etc/apache2/', '/etc/httpd/',
+    '/var/www/', '/etc/ansible-managed/'
+)
+
+@functools.lru_cache(maxsize=4096)
+def _severity_for_path(filepath):
+    """Map a path to a severity; str.startswith(tuple) checks all prefixes in C."""
+    if filepath.startswith(CRITICAL_PATHS):
+        return "critical"
+    if filepath.startswith(HIGH_PATHS):
+        return "high"
+    return "medium"
+
+def _compile_patterns(patterns):
+    """Combine glob patterns into one precompiled, case-sensitive name matcher."""
+    if not patterns:
+        return lambda name: None
+    return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns)).match
+
+def _walk(root, match):
+    """Yield DirEntry objects for regular files under root whose name matches.
+    
+    Symlinks to regular files are yielded like the files themselves, so
+    a file replaced by a link is still monitored (by its target's
+    content). Symlinked directories are not descended into.
+    """
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except OSError as e:
+        logger.debug(f"Cannot scan {root}: {str(e)}")
+        return
+    
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(entry.path, match)
+            elif entry.is_file() and match(entry.name):
+                yield entry
+        except OSError as e:
+            logger.debug(f"Cannot inspect {entry.path}: {str(e)}")
+
+def _scan_root(root, match):
+    """Walk one monitored root; returns (path, stat_result) for each matching file."""
+    found = []
+    for entry in _walk(root, match):
+        try:
+            # DirEntry caches the stat result from the walk; a link is
+            # stat()ed through, matching the content that gets hashed
+            found.append((entry.path, entry.stat()))
+        except OSError as e:
+            logger.error(f"Error processing {entry.path}: {str(e)}")
+    return found
+
 class DriftDetector:
-    def __init__(self, config_path):
+    def __init__(self, config_path, force_rehash=False):
         """Initialize drift detector with configuration."""
+        import yaml
+        
         with open(config_path, 'r') as f:
             self.config = yaml.safe_load(f)
         
-        self.detection_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.force_rehash = force_rehash
+        started = datetime.now()
+        self.detection_id = started.strftime("%Y%m%d_%H%M%S")
+        self.reports_dir = Path("reports/daily") / started.strftime('%Y/%m/%d')
         self.detections = []
+        # Detections per category; each check only fills its own list,
+        # and run_detection() joins them in DETECTION_CATEGORIES order
+        self._found = {category: [] for category in DETECTION_CATEGORIES}
         self.report_data = {
             "metadata": {
                 "detection_id": self.detection_id,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": started.isoformat(),
                 "hostname": os.uname().nodename
             },
             "summary": {
@@ -48,45 +175,81 @@ class DriftDetector:
             "detections": []
         }
         
+        # One timestamp for everything observed during this detection cycle
+        self._now_iso = self.report_data['metadata']['timestamp']
+        
         # Load previous state if exists
         self.previous_state = self.load_previous_state()
         
     def load_previous_state(self):
         """Load previous detection state."""
         state_file = "database/last_state.json"
+        files_index = "database/files.pkl"
+        state = {}
         if os.path.exists(state_file):
             try:
-                with open(state_file, 'r') as f:
-                    return json.load(f)
+                with open(state_file, 'rb') as f:
+                    state = json_loads(f.read())
             except Exception as e:
                 logger.warning(f"Failed to load previous state: {str(e)}")
-        return {}
+        
+        # The per-file index lives in a binary sidecar; older state files
+        # still carry it inline under 'files'
+        if os.path.exists(files_index):
+            try:
+                with open(files_index, 'rb') as f:
+                    state['files'] = pickle.load(f)
+            except Exception as e:
+                logger.warning(f"Failed to load previous file index: {str(e)}")
+        
+        # Checksums are raw digests; convert hex ones left by older runs
+        for entry in state.get('files', {}).values():
+            if isinstance(entry.get('checksum'), str):
+                entry['checksum'] = bytes.fromhex(entry['checksum'])
+        return state
     
     def save_current_state(self):
         """Save current state for next comparison."""
         state_file = "database/last_state.json"
+        files_index = "database/files.pkl"
         try:
-            with open(state_file, 'w') as f:
-                json.dump(self.report_data, f, indent=2)
-            logger.info(f"Current state saved to {state_file}")
+            # Machine-consumed, so skip indentation
+            state = {key: value for key, value in self.report_data.items() if key != 'files'}
+            write_json(state_file, state)
+            
+            with open(files_index, 'wb') as f:
+                pickle.dump(self.report_data.get('files', {}), f, protocol=pickle.HIGHEST_PROTOCOL)
+            logger.info(f"Current state saved to {state_file} and {files_index}")
         except Exception as e:
             logger.error(f"Failed to save state: {str(e)}")
     
-    def calculate_checksum(self, filepath, algorithm='sha256'):
-        """Calculate checksum of a file."""
+    def add_detection(self, detection):
+        """Record a detection in its category's list."""
+        self._found.setdefault(detection['category'], []).append(detection)
+    
+    @staticmethod
+    def calculate_checksum(filepath, algorithm='sha256'):
+        """Calculate the raw digest of a file."""
+        import hashlib
+        
         try:
-            if algorithm == 'sha256':
-                hash_func = hashlib.sha256()
-            elif algorithm == 'md5':
-                hash_func = hashlib.md5()
-            else:
-                hash_func = hashlib.sha256()
-            
             with open(filepath, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b''):
+                # Large files are mapped so OpenSSL reads the page cache directly
+                if os.fstat(f.fileno()).st_size > CHECKSUM_MMAP_THRESHOLD:
+                    hash_func = hashlib.new(algorithm)
+                    with mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ) as mm:
+                        hash_func.update(mm)
+                    return hash_func.digest()
+                
+                # file_digest (3.11+) hashes entirely in C without the GIL
+                if hasattr(hashlib, 'file_digest'):
+                    return hashlib.file_digest(f, algorithm).digest()
+                
+                hash_func = hashlib.new(algorithm)
+                for chunk in iter(lambda: f.read(CHECKSUM_BUFFER_SIZE), b''):
                     hash_func.update(chunk)
             
-            return hash_func.hexdigest()
+            return hash_func.digest()
         except Exception as e:
             logger.warning(f"Failed to calculate checksum for {filepath}: {str(e)}")
             return None
@@ -95,77 +258,116 @@ class DriftDetector:
         """Check for file changes in monitored paths."""
         logger.info("Checking for file changes...")
         
+        if 'files' not in self.report_data:
+            self.report_data['files'] = {}
+        previous_files = self.previous_state.get('files', {})
+        
+        # Each root is walked once, concurrently; stat() calls are I/O-bound
+        roots = []
         for path in self.config['detection']['monitored_paths']:
             if not os.path.exists(path):
                 logger.debug(f"Path does not exist: {path}")
                 continue
-            
-            for pattern in self.config['detection']['monitored_patterns']:
-                for filepath in Path(path).rglob(pattern):
-                    try:
-                        # Skip symlinks and directories
-                        if not filepath.is_file():
-                            continue
-                        
-                        # Calculate checksum
-                        checksum = self.calculate_checksum(str(filepath))
-                        if not checksum:
-                            continue
-                        
-                        # Compare with previous state
-                        file_key = str(filepath)
-                        previous_checksum = self.previous_state.get('files', {}).get(file_key, {}).get('checksum')
-                        
-                        if previous_checksum and previous_checksum != checksum:
-                            # File has changed!
-                            detection = {
-                                "type": "file_change",
-                                "timestamp": datetime.now().isoformat(),
-                                "file": file_key,
-                                "previous_checksum": previous_checksum,
-                                "current_checksum": checksum,
-                                "severity": self.assess_severity(file_key),
-                                "category": "file_integrity"
-                            }
-                            
-                            self.detections.append(detection)
-                            logger.info(f"File change detected: {file_key}")
-                        
-                        # Update current state
-                        if 'files' not in self.report_data:
-                            self.report_data['files'] = {}
-                        self.report_data['files'][file_key] = {
-                            "checksum": checksum,
-                            "last_checked": datetime.now().isoformat(),
-                            "size": filepath.stat().st_size
+            roots.append(path)
+        
+        match = _compile_patterns(self.config['detection']['monitored_patterns'])
+        with ThreadPoolExecutor(max_workers=max(len(roots), 1)) as executor:
+            scans = list(executor.map(lambda root: _scan_root(root, match), roots))
+        
+        # Collect files that need hashing so it can be fanned out
+        paths = {}
+        for scan in scans:
+            for file_key, st in scan:
+                # Quick check: same mtime and size means same content
+                previous = previous_files.get(file_key)
+                if (not self.force_rehash and previous
+                        and previous.get('checksum')
+                        and previous.get('mtime_ns') == st.st_mtime_ns
+                        and previous.get('size') == st.st_size):
+                    self.report_data['files'][file_key] = {
+                        "checksum": previous['checksum'],
+                        "last_checked": self._now_iso,
+                        "size": st.st_size,
+                        "mtime_ns": st.st_mtime_ns
+                    }
+                    continue
+                
+                paths[file_key] = st.st_mtime_ns
+        
+        # Hashing is CPU-bound, so spread it across processes
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=_MP_CONTEXT) as executor:
+            for file_key, checksum, size in executor.map(_hash_file, list(paths), chunksize=16):
+                try:
+                    if not checksum:
+                        continue
+                    
+                    # Compare with previous state
+                    previous_checksum = previous_files.get(file_key, {}).get('checksum')
+                    
+                    if previous_checksum and previous_checksum != checksum:
+                        # File has changed!
+                        detection = {
+                            "type": "file_change",
+                            "timestamp": self._now_iso,
+                            "file": file_key,
+                            "previous_checksum": previous_checksum.hex(),
+                            "current_checksum": checksum.hex(),
+                            "severity": self.assess_severity(file_key),
+                            "category": "file_integrity"
                         }
                         
-                    except Exception as e:
-                        logger.error(f"Error processing {filepath}: {str(e)}")
+                        self.add_detection(detection)
+                        logger.info(f"File change detected: {file_key}")
+                    
+                    # Update current state
+                    self.report_data['files'][file_key] = {
+                        "checksum": checksum,
+                        "last_checked": self._now_iso,
+                        "size": size,
+                        "mtime_ns": paths[file_key]
+                    }
+                    
+                except Exception as e:
+                    logger.error(f"Error processing {file_key}: {str(e)}")
         
-        logger.info(f"File change check complete. Found {len([d for d in self.detections if d['type'] == 'file_change'])} changes.")
+        logger.info(f"File change check complete. Found {len(self._found['file_integrity'])} changes.")
     
     def check_service_status(self):
         """Check for service status changes."""
+        import subprocess
+        
         logger.info("Checking service status...")
         
-        for service in self.config['detection']['monitored_services']:
+        services = self.config['detection']['monitored_services']
+        if not services:
+            return
+        
+        try:
+            # Query every service in one call; --value prints one
+            # ActiveState per unit, in argument order, blank-line separated
+            result = subprocess.run(
+                ["systemctl", "show", "--property=ActiveState", "--value", *services],
+                capture_output=True,
+                text=True
+            )
+            statuses = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+        except Exception as e:
+            logger.error(f"Error checking services: {str(e)}")
+            return
+        
+        if len(statuses) != len(services):
+            logger.error(f"Error checking services: expected {len(services)} states from systemctl, got {len(statuses)}")
+            return
+        
+        for service, current_status in zip(services, statuses):
             try:
-                # Check service status
-                result = subprocess.run(
-                    ["systemctl", "is-active", service],
-                    capture_output=True,
-                    text=True
-                )
-                
-                current_status = result.stdout.strip()
                 previous_status = self.previous_state.get('services', {}).get(service, {}).get('status')
                 
                 if previous_status and previous_status != current_status:
                     # Service status changed!
                     detection = {
                         "type": "service_status_change",
-                        "timestamp": datetime.now().isoformat(),
+                        "timestamp": self._now_iso,
                         "service": service,
                         "previous_status": previous_status,
                         "current_status": current_status,
@@ -173,7 +375,7 @@ class DriftDetector:
                         "category": "service_health"
                     }
                     
-                    self.detections.append(detection)
+                    self.add_detection(detection)
                     logger.info(f"Service status changed: {service} ({previous_status} -> {current_status})")
                 
                 # Update current state
@@ -182,7 +384,7 @@ class DriftDetector:
                 
                 self.report_data['services'][service] = {
                     "status": current_status,
-                    "last_checked": datetime.now().isoformat()
+                    "last_checked": self._now_iso
                 }
                 
             except Exception as e:
@@ -190,6 +392,8 @@ class DriftDetector:
     
     def check_package_changes(self):
         """Check for package installation/removal."""
+        import subprocess
+        
         logger.info("Checking package changes...")
         
         try:
@@ -197,11 +401,11 @@ class DriftDetector:
             if os.path.exists('/usr/bin/dpkg'):
                 # Debian/Ubuntu
                 result = subprocess.run(
-                    ["dpkg", "-l"],
+                    ["dpkg-query", "-W", "-f=${binary:Package}\\n"],
                     capture_output=True,
                     text=True
                 )
-                packages = [line.split()[1] for line in result.stdout.split('\n')[5:] if line]
+                packages = result.stdout.splitlines()
                 package_manager = "dpkg"
             elif os.path.exists('/usr/bin/rpm'):
                 # RHEL/Rocky
@@ -210,49 +414,49 @@ class DriftDetector:
                     capture_output=True,
                     text=True
                 )
-                packages = result.stdout.strip().split('\n')
+                packages = result.stdout.splitlines()
                 package_manager = "rpm"
             else:
                 logger.warning("Unsupported package manager")
                 return
             
-            current_packages = set(packages)
-            previous_packages = set(self.previous_state.get('packages', {}).get('installed', []))
+            current_packages = frozenset(map(sys.intern, filter(None, packages)))
+            previous_packages = frozenset(map(sys.intern, self.previous_state.get('packages', {}).get('installed', [])))
             
             # Find added packages
             added = current_packages - previous_packages
             # Find removed packages
             removed = previous_packages - current_packages
             
-            for package in added:
+            for package in sorted(added):
                 detection = {
                     "type": "package_added",
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": self._now_iso,
                     "package": package,
                     "action": "installed",
                     "severity": "medium",
                     "category": "package_management"
                 }
-                self.detections.append(detection)
+                self.add_detection(detection)
                 logger.info(f"Package added: {package}")
             
-            for package in removed:
+            for package in sorted(removed):
                 detection = {
                     "type": "package_removed",
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": self._now_iso,
                     "package": package,
                     "action": "removed",
                     "severity": "high",
                     "category": "package_management"
                 }
-                self.detections.append(detection)
+                self.add_detection(detection)
                 logger.info(f"Package removed: {package}")
             
             # Update current state
             self.report_data['packages'] = {
                 "manager": package_manager,
-                "installed": list(current_packages),
-                "last_checked": datetime.now().isoformat()
+                "installed": sorted(current_packages),
+                "last_checked": self._now_iso
             }
             
         except Exception as e:
@@ -263,14 +467,14 @@ class DriftDetector:
         logger.info("Checking user accounts...")
         
         try:
-            # Get current users
-            result = subprocess.run(
-                ["getent", "passwd"],
-                capture_output=True,
-                text=True
-            )
-            
-            current_users = set(line.split(':')[0] for line in result.stdout.strip().split('\n') if line)
+            import pwd
+        except ImportError:
+            logger.warning("User account checks are not supported on this platform")
+            return
+        
+        try:
+            # Get current users straight from NSS, same source as getent
+            current_users = set(entry.pw_name for entry in pwd.getpwall())
             previous_users = set(self.previous_state.get('users', {}).get('accounts', []))
             
             # Find added users
@@ -281,31 +485,31 @@ class DriftDetector:
             for user in added:
                 detection = {
                     "type": "user_added",
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": self._now_iso,
                     "user": user,
                     "action": "added",
                     "severity": "high",
                     "category": "user_management"
                 }
-                self.detections.append(detection)
+                self.add_detection(detection)
                 logger.info(f"User added: {user}")
             
             for user in removed:
                 detection = {
                     "type": "user_removed",
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": self._now_iso,
                     "user": user,
                     "action": "removed",
                     "severity": "critical",
                     "category": "user_management"
                 }
-                self.detections.append(detection)
+                self.add_detection(detection)
                 logger.info(f"User removed: {user}")
             
             # Update current state
             self.report_data['users'] = {
                 "accounts": list(current_users),
-                "last_checked": datetime.now().isoformat()
+                "last_checked": self._now_iso
             }
             
         except Exception as e:
@@ -313,39 +517,29 @@ class DriftDetector:
     
     def assess_severity(self, filepath):
         """Assess severity of a detected change."""
-        filepath_str = str(filepath)
-        
-        # Critical paths
-        critical_paths = [
-            '/etc/passwd', '/etc/shadow', '/etc/sudoers',
-            '/etc/ssh/sshd_config', '/root/', '/etc/cron'
-        ]
-        
-        # High importance paths
-        high_paths = [
-            '/etc/nginx/', '/etc/apache2/', '/etc/httpd/',
-            '/var/www/', '/etc/ansible-managed/'
-        ]
-        
-        for path in critical_paths:
-            if filepath_str.startswith(path):
-                return "critical"
-        
-        for path in high_paths:
-            if filepath_str.startswith(path):
-                return "high"
-        
-        return "medium"
+        return _severity_for_path(str(filepath))
     
     def run_detection(self):
         """Run all detection checks."""
         logger.info(f"=== Starting drift detection run {self.detection_id} ===")
         
-        # Run all detection methods
-        self.check_file_changes()
-        self.check_service_status()
-        self.check_package_changes()
-        self.check_user_accounts()
+        # Run all detection methods concurrently; most of their time is
+        # spent waiting on subprocesses and disk I/O
+        checks = (
+            self.check_file_changes,
+            self.check_service_status,
+            self.check_package_changes,
+            self.check_user_accounts
+        )
+        with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+            futures = [executor.submit(check) for check in checks]
+            for future in futures:
+                future.result()
+        
+        # Checks finish in any order; report their detections in a fixed one
+        for found in self._found.values():
+            self.detections.extend(found)
+            found.clear()
         
         # Update report data
         self.report_data['detections'] = self.detections
@@ -382,81 +576,83 @@ class DriftDetector:
     def generate_report(self):
         """Generate detection report."""
         # Ensure reports directory exists
-        reports_dir = f"reports/daily/{datetime.now().strftime('%Y/%m/%d')}"
-        os.makedirs(reports_dir, exist_ok=True)
+        self.reports_dir.mkdir(parents=True, exist_ok=True)
         
         # Generate JSON report
-        json_report = f"{reports_dir}/detection_{self.detection_id}.json"
-        with open(json_report, 'w') as f:
-            json.dump(self.report_data, f, indent=2)
+        json_report = self.reports_dir / f"detection_{self.detection_id}.json"
+        write_json(json_report, self.report_data, indent=True)
         
         # Generate summary report
-        summary_report = f"{reports_dir}/summary_{self.detection_id}.md"
+        summary_report = self.reports_dir / f"summary_{self.detection_id}.md"
         self.generate_markdown_report(summary_report)
         
         # Generate HTML report
-        html_report = f"{reports_dir}/report_{self.detection_id}.html"
+        html_report = self.reports_dir / f"report_{self.detection_id}.html"
         self.generate_html_report(html_report)
         
-        # Update latest report symlink
+        # Update latest report symlink; swapped in atomically so readers
+        # never find it missing
         latest_link = "reports/latest.json"
-        if os.path.exists(latest_link):
-            os.remove(latest_link)
-        os.symlink(os.path.abspath(json_report), latest_link)
+        tmp_link = f"{latest_link}.{os.getpid()}.tmp"
+        os.symlink(os.path.abspath(json_report), tmp_link)
+        os.replace(tmp_link, latest_link)
         
-        return json_report
+        return str(json_report)
     
     def generate_markdown_report(self, filepath):
         """Generate markdown summary report."""
         try:
+            lines = []
+            lines.append(f"# Drift Detection Report\n")
+            lines.append(f"**Detection ID:** {self.detection_id}\n")
+            lines.append(f"**Timestamp:** {datetime.now().isoformat()}\n")
+            lines.append(f"**Hostname:** {os.uname().nodename}\n\n")
+            
+            lines.append("## Summary\n")
+            lines.append(f"- **Total Detections:** {len(self.detections)}\n")
+            
+            if self.report_data['summary']['by_severity']:
+                lines.append("\n### By Severity\n")
+                for severity, count in self.report_data['summary']['by_severity'].items():
+                    lines.append(f"- **{severity.upper()}:** {count}\n")
+            
+            if self.report_data['summary']['by_category']:
+                lines.append("\n### By Category\n")
+                for category, count in self.report_data['summary']['by_category'].items():
+                    lines.append(f"- **{category}:** {count}\n")
+            
+            if self.detections:
+                lines.append("\n## Detailed Detections\n")
+                for i, detection in enumerate(self.detections, 1):
+                    lines.append(f"\n### Detection #{i}\n")
+                    lines.append(f"- **Type:** {detection['type']}\n")
+                    lines.append(f"- **Severity:** {detection['severity']}\n")
+                    lines.append(f"- **Category:** {detection['category']}\n")
+                    lines.append(f"- **Timestamp:** {detection['timestamp']}\n")
+                    
+                    if detection['type'] == 'file_change':
+                        lines.append(f"- **File:** {detection['file']}\n")
+                        lines.append(f"- **Previous Checksum:** {detection['previous_checksum'][:16]}...\n")
+                        lines.append(f"- **Current Checksum:** {detection['current_checksum'][:16]}...\n")
+                    
+                    elif detection['type'] == 'service_status_change':
+                        lines.append(f"- **Service:** {detection['service']}\n")
+                        lines.append(f"- **Previous Status:** {detection['previous_status']}\n")
+                        lines.append(f"- **Current Status:** {detection['current_status']}\n")
+                    
+                    elif detection['type'] in ['package_added', 'package_removed']:
+                        lines.append(f"- **Package:** {detection['package']}\n")
+                        lines.append(f"- **Action:** {detection['action']}\n")
+                    
+                    elif detection['type'] in ['user_added', 'user_removed']:
+                        lines.append(f"- **User:** {detection['user']}\n")
+                        lines.append(f"- **Action:** {detection['action']}\n")
+            
+            lines.append("\n---\n")
+            lines.append("*Report generated by Configuration Drift Detection Platform*\n")
+            
             with open(filepath, 'w') as f:
-                f.write(f"# Drift Detection Report\n")
-                f.write(f"**Detection ID:** {self.detection_id}\n")
-                f.write(f"**Timestamp:** {datetime.now().isoformat()}\n")
-                f.write(f"**Hostname:** {os.uname().nodename}\n\n")
-                
-                f.write("## Summary\n")
-                f.write(f"- **Total Detections:** {len(self.detections)}\n")
-                
-                if self.report_data['summary']['by_severity']:
-                    f.write("\n### By Severity\n")
-                    for severity, count in self.report_data['summary']['by_severity'].items():
-                        f.write(f"- **{severity.upper()}:** {count}\n")
-                
-                if self.report_data['summary']['by_category']:
-                    f.write("\n### By Category\n")
-                    for category, count in self.report_data['summary']['by_category'].items():
-                        f.write(f"- **{category}:** {count}\n")
-                
-                if self.detections:
-                    f.write("\n## Detailed Detections\n")
-                    for i, detection in enumerate(self.detections, 1):
-                        f.write(f"\n### Detection #{i}\n")
-                        f.write(f"- **Type:** {detection['type']}\n")
-                        f.write(f"- **Severity:** {detection['severity']}\n")
-                        f.write(f"- **Category:** {detection['category']}\n")
-                        f.write(f"- **Timestamp:** {detection['timestamp']}\n")
-                        
-                        if detection['type'] == 'file_change':
-                            f.write(f"- **File:** {detection['file']}\n")
-                            f.write(f"- **Previous Checksum:** {detection['previous_checksum'][:16]}...\n")
-                            f.write(f"- **Current Checksum:** {detection['current_checksum'][:16]}...\n")
-                        
-                        elif detection['type'] == 'service_status_change':
-                            f.write(f"- **Service:** {detection['service']}\n")
-                            f.write(f"- **Previous Status:** {detection['previous_status']}\n")
-                            f.write(f"- **Current Status:** {detection['current_status']}\n")
-                        
-                        elif detection['type'] in ['package_added', 'package_removed']:
-                            f.write(f"- **Package:** {detection['package']}\n")
-                            f.write(f"- **Action:** {detection['action']}\n")
-                        
-                        elif detection['type'] in ['user_added', 'user_removed']:
-                            f.write(f"- **User:** {detection['user']}\n")
-                            f.write(f"- **Action:** {detection['action']}\n")
-                
-                f.write("\n---\n")
-                f.write("*Report generated by Configuration Drift Detection Platform*\n")
+                f.write("".join(lines))
             
             logger.info(f"Markdown report generated: {filepath}")
             
@@ -524,29 +720,31 @@ class DriftDetector:
             """
             
             # Generate severity summary HTML
-            severity_html = ""
+            severity_parts = []
             if self.report_data['summary']['by_severity']:
-                severity_html = "<h3>Detections by Severity</h3><table>"
-                severity_html += "<tr><th>Severity</th><th>Count</th></tr>"
+                severity_parts.append("<h3>Detections by Severity</h3><table>")
+                severity_parts.append("<tr><th>Severity</th><th>Count</th></tr>")
                 for severity, count in self.report_data['summary']['by_severity'].items():
-                    severity_html += f"<tr><td><span class='badge badge-{severity}'>{severity.upper()}</span></td><td>{count}</td></tr>"
-                severity_html += "</table>"
+                    severity_parts.append(f"<tr><td><span class='badge badge-{severity}'>{severity.upper()}</span></td><td>{count}</td></tr>")
+                severity_parts.append("</table>")
+            severity_html = "".join(severity_parts)
             
             # Generate category summary HTML
-            category_html = ""
+            category_parts = []
             if self.report_data['summary']['by_category']:
-                category_html = "<h3>Detections by Category</h3><table>"
-                category_html += "<tr><th>Category</th><th>Count</th></tr>"
+                category_parts.append("<h3>Detections by Category</h3><table>")
+                category_parts.append("<tr><th>Category</th><th>Count</th></tr>")
                 for category, count in self.report_data['summary']['by_category'].items():
-                    category_html += f"<tr><td>{category}</td><td>{count}</td></tr>"
-                category_html += "</table>"
+                    category_parts.append(f"<tr><td>{category}</td><td>{count}</td></tr>")
+                category_parts.append("</table>")
+            category_html = "".join(category_parts)
             
             # Generate detections table HTML
-            detections_html = ""
+            detection_parts = []
             if self.detections:
-                detections_html = "<h2>Detailed Detections</h2>"
+                detection_parts.append("<h2>Detailed Detections</h2>")
                 for detection in self.detections:
-                    detections_html += f"""
+                    detection_parts.append(f"""
                     <div class="detection-card">
                         <div class="detection-header">
                             <h4>{detection['type'].replace('_', ' ').title()}</h4>
@@ -554,25 +752,26 @@ class DriftDetector:
                         </div>
                         <p><strong>Category:</strong> {detection['category']}</p>
                         <p><strong>Timestamp:</strong> {detection['timestamp']}</p>
-                    """
+                    """)
                     
                     if detection['type'] == 'file_change':
-                        detections_html += f"<p><strong>File:</strong> {detection['file']}</p>"
-                        detections_html += f"<p><strong>Checksum Change:</strong> {detection['previous_checksum'][:16]}... → {detection['current_checksum'][:16]}...</p>"
+                        detection_parts.append(f"<p><strong>File:</strong> {detection['file']}</p>")
+                        detection_parts.append(f"<p><strong>Checksum Change:</strong> {detection['previous_checksum'][:16]}... → {detection['current_checksum'][:16]}...</p>")
                     
                     elif detection['type'] == 'service_status_change':
-                        detections_html += f"<p><strong>Service:</strong> {detection['service']}</p>"
-                        detections_html += f"<p><strong>Status Change:</strong> {detection['previous_status']} → {detection['current_status']}</p>"
+                        detection_parts.append(f"<p><strong>Service:</strong> {detection['service']}</p>")
+                        detection_parts.append(f"<p><strong>Status Change:</strong> {detection['previous_status']} → {detection['current_status']}</p>")
                     
                     elif detection['type'] in ['package_added', 'package_removed']:
-                        detections_html += f"<p><strong>Package:</strong> {detection['package']}</p>"
-                        detections_html += f"<p><strong>Action:</strong> {detection['action']}</p>"
+                        detection_parts.append(f"<p><strong>Package:</strong> {detection['package']}</p>")
+                        detection_parts.append(f"<p><strong>Action:</strong> {detection['action']}</p>")
                     
                     elif detection['type'] in ['user_added', 'user_removed']:
-                        detections_html += f"<p><strong>User:</strong> {detection['user']}</p>"
-                        detections_html += f"<p><strong>Action:</strong> {detection['action']}</p>"
+                        detection_parts.append(f"<p><strong>User:</strong> {detection['user']}</p>")
+                        detection_parts.append(f"<p><strong>Action:</strong> {detection['action']}</p>")
                     
-                    detections_html += "</div>"
+                    detection_parts.append("</div>")
+            detections_html = "".join(detection_parts)
             
             # Fill template
             html_content = html_template.format(
@@ -594,15 +793,29 @@ class DriftDetector:
         except Exception as e:
             logger.error(f"Failed to generate HTML report: {str(e)}")
 
+def _hash_file(filepath):
+    """Hash a single file in a worker process; returns (path, checksum, size)."""
+    try:
+        size = os.stat(filepath).st_size
+    except OSError as e:
+        logger.warning(f"Failed to stat {filepath}: {str(e)}")
+        return filepath, None, None
+    return filepath, DriftDetector.calculate_checksum(filepath), size
+
 def main():
     """Main function."""
+    parser = argparse.ArgumentParser(description='Configuration Drift Detection Engine')
+    parser.add_argument('--force-rehash', action='store_true',
+                        help='Rehash every monitored file, ignoring the mtime/size quick check')
+    args = parser.parse_args()
+    
     config_path = "config/detection_config.yaml"
     
     if not os.path.exists(config_path):
         print(f"Configuration file not found: {config_path}")
         sys.exit(1)
     
-    detector = DriftDetector(config_path)
+    detector = DriftDetector(config_path, force_rehash=args.force_rehash)
     report_data = detector.run_detection()
     
     print("\n" + "="*60)
@@ -616,7 +829,7 @@ def main():
         for severity, count in report_data['summary']['by_severity'].items():
             print(f"  {severity.upper()}: {count}")
     
-    print(f"\nReports generated in: reports/daily/{datetime.now().strftime('%Y/%m/%d')}/")
+    print(f"\nReports generated in: {detector.reports_dir}/")
     print("="*60)
     
     # Return exit code based on detections
@@ -7,19 +7,44 @@ import os
 import sys
 import json
 import shutil
-from datetime import datetime
+import queue
+import threading
+from datetime import datetime, timedelta
 import subprocess
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def git_env():
+    """Environment for git subprocesses.
+    
+    Read-only commands skip optional lock files, and nothing ever waits
+    on an interactive credential prompt.
+    """
+    return {**os.environ, "GIT_OPTIONAL_LOCKS": "0", "GIT_TERMINAL_PROMPT": "0"}
+
 class GitAuditTrail:
-    def __init__(self, repo_path, branch="reports"):
+    def __init__(self, repo_path, branch="reports", push_batch_size=10):
         self.repo_path = repo_path
         self.branch = branch
+        # Reports committed locally before add_report pushes them as one batch
+        self.push_batch_size = push_batch_size
         self.working_dir = "/tmp/drift-reports"
         
+        # Long-running `git fast-import` that receives one commit per report
+        self._fast_import = None
+        self._pending_commits = 0
+        
+        # Pushes run on a background thread fed through _push_queue, so
+        # add_report never waits on the network; _lock serializes access
+        # to fast-import between the caller and that thread
+        self._lock = threading.Lock()
+        self._push_queue = queue.Queue()
+        self._push_worker = None
+        self._push_ok = True
+        
         # Create working directory
         os.makedirs(self.working_dir, exist_ok=True)
     
@@ -28,88 +53,280 @@ class GitAuditTrail:
         if not os.path.exists(self.repo_path):
             logger.info(f"Creating new Git repository at {self.repo_path}")
             os.makedirs(self.repo_path, exist_ok=True)
-            subprocess.run(["git", "init", "--bare", self.repo_path], check=True)
+            subprocess.run(["git", "init", "--bare", self.repo_path], env=git_env(), check=True)
         
         # Clone to working directory
         if os.path.exists(os.path.join(self.working_dir, ".git")):
             # Pull latest
-            os.chdir(self.working_dir)
-            subprocess.run(["git", "pull", "origin", self.branch], check=False)
+            subprocess.run(["git", "pull", "origin", self.branch],
+                           cwd=self.working_dir, env=git_env(), check=False)
         else:
             # Clone fresh
             if os.path.exists(self.working_dir):
                 shutil.rmtree(self.working_dir)
-            subprocess.run(["git", "clone", self.repo_path, self.working_dir], check=True)
-            os.chdir(self.working_dir)
+            subprocess.run(["git", "clone", self.repo_path, self.working_dir], env=git_env(), check=True)
             
             # Checkout reports branch
-            subprocess.run(["git", "checkout", "-b", self.branch], check=False)
-            subprocess.run(["git", "checkout", self.branch], check=True)
+            subprocess.run(["git", "checkout", "-b", self.branch],
+                           cwd=self.working_dir, env=git_env(), check=False)
+            subprocess.run(["git", "checkout", self.branch],
+                           cwd=self.working_dir, env=git_env(), check=True)
+    
+    def _start_fast_import(self):
+        """Start the persistent fast-import helper for the working clone."""
+        # Committer identity as git itself would resolve it, minus the date
+        ident = subprocess.run(
+            ["git", "var", "GIT_COMMITTER_IDENT"],
+            cwd=self.working_dir, env=git_env(), capture_output=True, text=True, check=True
+        ).stdout.strip()
+        self._committer = ident.rsplit(' ', 2)[0]
+        
+        # Continue the existing branch on the first commit, if there is one
+        tip = subprocess.run(
+            ["git", "rev-parse", "--verify", "--quiet", f"refs/heads/{self.branch}"],
+            cwd=self.working_dir, env=git_env(), capture_output=True
+        )
+        self._parent_ref = f"refs/heads/{self.branch}^0" if tip.returncode == 0 else None
+        
+        self._fast_import = subprocess.Popen(
+            ["git", "fast-import", "--quiet", "--date-format=now"],
+            cwd=self.working_dir, env=git_env(), stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+    
+    def _write_commit(self, path, data, message):
+        """Send a single-file commit with the given content to fast-import.
+        
+        The whole commit is built before anything is written, so a bad
+        report can't leave half a commit in the stream. If the write
+        itself fails, fast-import is killed and restarted on the next
+        commit; commits it held since the last checkpoint are lost.
+        """
+        if self._fast_import is None:
+            self._start_fast_import()
+        
+        message = message.encode('utf-8')
+        command = [
+            f"commit refs/heads/{self.branch}".encode(),
+            f"committer {self._committer} now".encode(),
+            f"data {len(message)}".encode(),
+            message
+        ]
+        if self._parent_ref:
+            command.append(f"from {self._parent_ref}".encode())
+        command += [
+            f"M 100644 inline {path}".encode(),
+            f"data {len(data)}".encode(),
+            data,
+            b""
+        ]
+        block = b"\n".join(command)
+        
+        try:
+            self._fast_import.stdin.write(block)
+            self._fast_import.stdin.flush()
+        except Exception:
+            self._abort_fast_import()
+            raise
+        self._parent_ref = None
+        self._pending_commits += 1
+    
+    def _abort_fast_import(self):
+        """Kill fast-import after a failed write, dropping its unsaved commits."""
+        process, self._fast_import = self._fast_import, None
+        process.kill()
+        process.wait()
+        self._pending_commits = 0
+        logger.error("git fast-import failed; commits since the last checkpoint were lost")
+    
+    def _sync_worktree(self):
+        """Move the clone's index and worktree to the branch tip.
+        
+        fast-import only updates the ref, so without this the committed
+        reports would show up in the clone as staged deletions. Nothing
+        is done unless the branch is checked out.
+        """
+        head = subprocess.run(
+            ["git", "symbolic-ref", "-q", "HEAD"],
+            cwd=self.working_dir, env=git_env(), capture_output=True, text=True
+        )
+        if head.stdout.strip() != f"refs/heads/{self.branch}":
+            return
+        
+        # Two-tree merge from what the index holds now to the new tip
+        tree = subprocess.run(
+            ["git", "write-tree"],
+            cwd=self.working_dir, env=git_env(), capture_output=True, text=True, check=True
+        ).stdout.strip()
+        subprocess.run(["git", "read-tree", "-m", "-u", tree, "HEAD"],
+                       cwd=self.working_dir, env=git_env(), check=True)
     
     def add_report(self, report_path, report_type="detection"):
-        """Add a report to the audit trail."""
+        """Add a report to the audit trail.
+        
+        The commit is handed to fast-import and pushed in the background
+        together with others once push_batch_size commits are pending.
+        flush() or close() waits for everything to be pushed.
+        """
         try:
             # Generate timestamp and filename
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"{report_type}_{timestamp}.json"
-            dest_path = os.path.join(self.working_dir, "reports", filename)
             
-            # Create reports directory
-            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-            
-            # Copy report
-            shutil.copy2(report_path, dest_path)
+            with open(report_path, 'rb') as f:
+                data = f.read()
             
             # Generate commit message
-            with open(report_path, 'r') as f:
-                report_data = json.load(f)
+            report_data = json.loads(data)
             
             total_detections = report_data.get('summary', {}).get('total_detections', 0)
             
             commit_msg = f"[DRIFT] {report_type.capitalize()} report: {total_detections} detections at {timestamp}"
             
-            # Add, commit, and push
-            subprocess.run(["git", "add", dest_path], check=True)
-            subprocess.run(["git", "commit", "-m", commit_msg], check=True)
-            subprocess.run(["git", "push", "origin", self.branch], check=True)
+            # Commit through fast-import; pushing is batched
+            with self._lock:
+                self._write_commit(f"reports/{filename}", data, commit_msg)
+                push_due = self._pending_commits >= self.push_batch_size
             
             logger.info(f"Report added to audit trail: {filename}")
+            
+            if push_due:
+                self._request_push()
             return True
             
         except Exception as e:
             logger.error(f"Failed to add report to audit trail: {str(e)}")
             return False
     
-    def get_audit_log(self, days=7):
-        """Get audit log for the specified number of days."""
-        os.chdir(self.working_dir)
+    def _request_push(self):
+        """Queue a push for the background worker, starting it on first use."""
+        if self._push_worker is None:
+            self._push_worker = threading.Thread(
+                target=self._push_loop, name="git-audit-push", daemon=True
+            )
+            self._push_worker.start()
+        self._push_queue.put(True)
+    
+    def _push_loop(self):
+        """Serve push requests until close() queues None."""
+        stop = False
+        while not stop:
+            requests = [self._push_queue.get()]
+            # Requests that piled up during the last push share one push
+            while True:
+                try:
+                    requests.append(self._push_queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in requests
+            
+            self._push_ok = self._push_pending()
+            for _ in requests:
+                self._push_queue.task_done()
+    
+    def _push_pending(self):
+        """Checkpoint pending commits and push them in a single `git push`."""
+        with self._lock:
+            pending = self._pending_commits
+            if not pending:
+                return True
+            self._pending_commits = 0
         
+        try:
+            with self._lock:
+                # Ask fast-import to update refs, then wait until it reports back
+                self._fast_import.stdin.write(b"checkpoint\nprogress checkpoint\n")
+                self._fast_import.stdin.flush()
+                for line in self._fast_import.stdout:
+                    if line.strip() == b"progress checkpoint":
+                        break
+                else:
+                    raise RuntimeError("git fast-import exited before checkpoint completed")
+            
+            self._sync_worktree()
+            
+            subprocess.run(["git", "push", "origin", self.branch],
+                           cwd=self.working_dir, env=git_env(), check=True)
+            
+            logger.info(f"Pushed {pending} report(s) to audit trail")
+            return True
+            
+        except Exception as e:
+            # Leave the commits pending so the next push retries them
+            with self._lock:
+                self._pending_commits += pending
+            logger.error(f"Failed to push audit trail: {str(e)}")
+            return False
+    
+    def flush(self):
+        """Push all pending commits and wait for the push to finish."""
+        if self._push_worker is None and not self._pending_commits:
+            return True
+        
+        self._request_push()
+        self._push_queue.join()
+        return self._push_ok
+    
+    def close(self):
+        """Flush pending commits and stop the push worker and fast-import."""
+        result = self.flush()
+        if self._push_worker is not None:
+            self._push_queue.put(None)
+            self._push_worker.join()
+            self._push_worker = None
+        if self._fast_import is not None:
+            self._fast_import.stdin.close()
+            self._fast_import.wait()
+            self._fast_import = None
+            self._sync_worktree()
+        return result
+    
+    def get_audit_log(self, days=7, update=True):
+        """Get audit log for the specified number of days."""
         # Update from remote
-        subprocess.run(["git", "pull"], check=False)
+        if update:
+            subprocess.run(["git", "pull"], cwd=self.working_dir, env=git_env(), check=False)
         
         # Get commit history
-        since_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        since_date = self._since_date(days)
+        # NUL-separated fields and records, so subjects may contain anything
         result = subprocess.run(
-            ["git", "log", f"--since={since_date}", "--pretty=format:%H|%ad|%s", "--date=iso"],
-            capture_output=True,
-            text=True
+            ["git", "log", f"--since={since_date}", "-z", "--pretty=format:%H%x00%ad%x00%s", "--date=iso"],
+            cwd=self.working_dir, env=git_env(), capture_output=True
         )
         
-        audit_log = []
-        for line in result.stdout.strip().split('\n'):
-            if line:
-                commit_hash, date, message = line.split('|', 2)
-                audit_log.append({
-                    "hash": commit_hash,
-                    "date": date,
-                    "message": message
-                })
+        fields = result.stdout.decode('utf-8', errors='replace').split('\0')
+        audit_log = [
+            {"hash": commit_hash, "date": date, "message": message}
+            for commit_hash, date, message in zip(fields[0::3], fields[1::3], fields[2::3])
+        ]
         
         return audit_log
     
+    @staticmethod
+    def _since_date(days):
+        """Return the --since date for a window of the last days."""
+        return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    
+    def _count_commits(self, days, pattern, invert=False):
+        """Count commits in the last days whose message contains pattern."""
+        command = ["git", "rev-list", "--count", f"--since={self._since_date(days)}",
+                   "--fixed-strings", f"--grep={pattern}", "HEAD"]
+        if invert:
+            command.insert(-1, "--invert-grep")
+        result = subprocess.run(command, cwd=self.working_dir, env=git_env(), capture_output=True, text=True)
+        return int(result.stdout.strip() or 0)
+    
     def generate_audit_report(self, output_file):
         """Generate an audit report."""
-        audit_log = self.get_audit_log(days=30)
+        subprocess.run(["git", "pull"], cwd=self.working_dir, env=git_env(), check=False)
+        
+        # The log and the per-type counts are independent git calls
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            log_future = executor.submit(self.get_audit_log, 30, False)
+            detection_future = executor.submit(self._count_commits, 30, "[DRIFT] Detection")
+            remediation_future = executor.submit(self._count_commits, 30, "[DRIFT] Remediation")
+            other_future = executor.submit(self._count_commits, 30, "[DRIFT]", True)
+        audit_log = log_future.result()
         
         report = {
             "generated_at": datetime.now().isoformat(),
@@ -117,9 +334,9 @@ class GitAuditTrail:
             "total_commits": len(audit_log),
             "commits": audit_log,
             "summary": {
-                "detection_reports": len([c for c in audit_log if "[DRIFT] Detection" in c['message']]),
-                "remediation_reports": len([c for c in audit_log if "[DRIFT] Remediation" in c['message']]),
-                "other_reports": len([c for c in audit_log if "[DRIFT]" not in c['message']])
+                "detection_reports": detection_future.result(),
+                "remediation_reports": remediation_future.result(),
+                "other_reports": other_future.result()
             }
         }
         
@@ -136,7 +353,7 @@ def main():
     # Create if doesn't exist
     if not os.path.exists(repo_path):
         os.makedirs(os.path.dirname(repo_path), exist_ok=True)
-        subprocess.run(["git", "init", "--bare", repo_path], check=True)
+        subprocess.run(["git", "init", "--bare", repo_path], env=git_env(), check=True)
         print(f"Created new audit repository at {repo_path}")
     
     auditor = GitAuditTrail(repo_path)
@@ -161,6 +378,7 @@ def main():
     
     # Add to audit trail
     auditor.add_report(sample_path, "test")
+    auditor.close()
     
     # Generate audit report
     audit_report = auditor.generate_audit_report("/tmp/audit_report.json")
@@ -3,12 +3,19 @@
 Flask API server for serving drift detection reports.
 """
 
-from flask import Flask, jsonify, render_template_string, send_file, abort
+from flask import Flask, jsonify, request, send_file, abort
+import hashlib
 import json
+import multiprocessing
 import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 import logging
+from urllib.parse import quote
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -16,10 +23,20 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configuration
 REPORTS_BASE_DIR = "reports"
 API_VERSION = "1.0"
 
+# When set (e.g. "/internal/reports/"), report files are handed off to the
+# fronting nginx with X-Accel-Redirect instead of being sent from Python.
+# The prefix must map to an internal location aliased to REPORTS_BASE_DIR.
+ACCEL_REDIRECT_PREFIX = os.environ.get("REPORT_API_ACCEL_REDIRECT_PREFIX", "")
+
 # HTML template for web interface
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -75,7 +92,7 @@ HTML_TEMPLATE = """
             <div class="endpoint">
                 <h3><span class="method">GET</span> /api/v1/reports/date/YYYY/MM/DD</h3>
                 <p>Get reports for a specific date.</p>
-                <code><a href="/api/v1/reports/date/{{ today.strftime('%Y/%m/%d') }}">/api/v1/reports/date/{{ today.strftime('%Y/%m/%d') }}</a></code>
+                <code><a href="/api/v1/reports/date/{{ today_path }}">/api/v1/reports/date/{{ today_path }}</a></code>
             </div>
             
             <div class="endpoint">
@@ -128,33 +145,273 @@ HTML_TEMPLATE = """
 </html>
 """
 
-def find_reports():
-    """Find all report files."""
-    reports = []
+# Compiled once; Flask's environment autoescapes templates built from strings
+_INDEX_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+
+def json_loads(data):
+    """Parse JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj):
+    """Encode obj as compact JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+def json_response(payload, status=200):
+    """Build a JSON response, encoding with orjson when it is installed."""
+    if orjson is not None:
+        return app.response_class(orjson.dumps(payload), status=status, mimetype='application/json')
+    response = jsonify(payload)
+    response.status_code = status
+    return response
+
+def cached_json_response(etag, build_payload, max_age=None, stream=False):
+    """Build a JSON response tagged with etag, or a 304 if the client has it.
+    
+    build_payload is only called when the client's copy is stale. With
+    stream it must return an iterable of encoded JSON chunks, which are
+    sent as they are produced. With max_age the response may be reused
+    without revalidation for that many seconds; otherwise clients must
+    revalidate every time.
+    """
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    elif stream:
+        response = app.response_class(build_payload(), mimetype='application/json')
+    else:
+        response = json_response(build_payload())
     
-    for json_file in Path(REPORTS_BASE_DIR).rglob("*.json"):
+    response.set_etag(etag)
+    if max_age is None:
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    return response
+
+# Parsed reports keyed by path, as ((st_mtime_ns, st_size), report); a
+# report is only re-read when its mtime or size changes
+_REPORT_CACHE = {}
+
+# Sorted report listing shared by all requests for REPORT_LIST_TTL seconds
+REPORT_LIST_TTL = 5
+_REPORT_LIST = {"reports": None, "by_id": {}, "by_dir": {}, "totals": None, "version": "",
+                "expires": 0.0, "scanned": 0.0}
+_CACHE_LOCK = threading.Lock()
+
+# Minimum seconds between the early rescans triggered by unknown report IDs
+MISS_RESCAN_INTERVAL = 1
+
+# Running totals over _REPORT_CACHE, adjusted as reports are added,
+# modified or removed so /api/v1/summary never re-sums every report
+_TOTALS = {"detections": 0, "severities": Counter(), "by_date": Counter()}
+
+# Reports encoded per chunk of the streamed /api/v1/reports listing
+LISTING_CHUNK_SIZE = 256
+
+# Cold scans with at least this many unparsed files are spread over a
+# process pool; smaller batches are cheaper to parse inline
+PARALLEL_PARSE_MIN_FILES = 32
+
+# Parse workers are started by a fork server instead of forking the
+# threaded server process, which can deadlock on locks other threads hold
+_MP_CONTEXT = multiprocessing.get_context("forkserver")
+
+def _iter_json_files(directory):
+    """Yield (path, (st_mtime_ns, st_size)) for every JSON file below directory."""
+    try:
+        with os.scandir(directory) as it:
+            entries = list(it)
+    except OSError as e:
+        logger.warning(f"Error scanning {directory}: {str(e)}")
+        return
+    
+    for entry in entries:
         try:
-            with open(json_file, 'r') as f:
-                report_data = json.load(f)
-            
-            # Extract report ID from filename
-            report_id = json_file.stem.replace('detection_', '').replace('report_', '')
-            
-            reports.append({
-                "id": report_id,
-                "path": str(json_file),
-                "timestamp": report_data.get('metadata', {}).get('timestamp', ''),
-                "detections": report_data.get('summary', {}).get('total_detections', 0),
-                "severities": report_data.get('summary', {}).get('by_severity', {}),
-                "data": report_data
-            })
-        except Exception as e:
-            logger.warning(f"Error reading report {json_file}: {str(e)}")
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_json_files(entry.path)
+            elif entry.name.endswith('.json') and entry.is_file():
+                st = entry.stat()
+                yield entry.path, (st.st_mtime_ns, st.st_size)
+        except OSError as e:
+            logger.warning(f"Error reading report {entry.path}: {str(e)}")
+
+def _load_report(json_file):
+    """Parse one report file into its listing entry."""
+    report_data = json_loads(Path(json_file).read_bytes())
+    
+    # Extract report ID from filename
+    report_id = Path(json_file).stem.replace('detection_', '').replace('report_', '')
+    
+    return {
+        "id": report_id,
+        "path": json_file,
+        "timestamp": report_data.get('metadata', {}).get('timestamp', ''),
+        "detections": report_data.get('summary', {}).get('total_detections', 0),
+        "severities": report_data.get('summary', {}).get('by_severity', {}),
+        "data": report_data
+    }
+
+def _try_load_report(json_file):
+    """Parse one report file, returning (report, error) instead of raising."""
+    try:
+        return _load_report(json_file), None
+    except Exception as e:
+        return None, str(e)
+
+def _apply_totals(report, sign):
+    """Add (sign=1) or remove (sign=-1) one report's share of _TOTALS."""
+    _TOTALS['detections'] += sign * report['detections']
+    
+    severities = _TOTALS['severities']
+    for severity, count in report['severities'].items():
+        severities[severity] += sign * count
+        if not severities[severity]:
+            del severities[severity]
+    
+    if report['timestamp']:
+        by_date = _TOTALS['by_date']
+        date = report['timestamp'][:10]  # YYYY-MM-DD
+        by_date[date] += sign
+        if not by_date[date]:
+            del by_date[date]
+
+def _scan_reports():
+    """Rescan the reports tree, parsing only new or modified files."""
+    cache = {}
+    misses = []
+    for json_file, stamp in _iter_json_files(REPORTS_BASE_DIR):
+        cached = _REPORT_CACHE.get(json_file)
+        if cached and cached[0] == stamp:
+            cache[json_file] = cached
+        else:
+            misses.append((json_file, stamp))
+    
+    paths = [json_file for json_file, _ in misses]
+    if len(paths) >= PARALLEL_PARSE_MIN_FILES:
+        workers = os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_MP_CONTEXT) as executor:
+            results = list(executor.map(_try_load_report, paths,
+                                        chunksize=max(1, len(paths) // (workers * 4))))
+    else:
+        results = map(_try_load_report, paths)
+    
+    for (json_file, stamp), (report, error) in zip(misses, results):
+        if error is not None:
+            logger.warning(f"Error reading report {json_file}: {error}")
+            continue
+        report['mtime_ns'] = stamp[0]
+        cache[json_file] = (stamp, report)
+    
+    # Back out reports that were removed or modified, then count the new ones
+    changed = False
+    for json_file, entry in _REPORT_CACHE.items():
+        if cache.get(json_file) is not entry:
+            _apply_totals(entry[1], -1)
+            changed = True
+    for json_file, entry in cache.items():
+        if _REPORT_CACHE.get(json_file) is not entry:
+            _apply_totals(entry[1], 1)
+            changed = True
+    
+    # Dropping entries that were not seen evicts deleted reports
+    _REPORT_CACHE.clear()
+    _REPORT_CACHE.update(cache)
+    
+    reports = [report for _, report in cache.values()]
     
     # Sort by timestamp (newest first)
     reports.sort(key=lambda x: x['timestamp'], reverse=True)
+    
+    # Index by report ID (the newest report wins when IDs collide) and
+    # by containing directory for the per-date listing
+    by_id = {}
+    by_dir = {}
+    for report in reports:
+        by_id.setdefault(report['id'], report)
+        by_dir.setdefault(os.path.dirname(report['path']), []).append(report)
+    _REPORT_LIST['by_id'] = by_id
+    _REPORT_LIST['by_dir'] = by_dir
+    
+    # A digest of every report's path, mtime and size: it changes whenever
+    # a report is added, modified or removed, and is the same in every
+    # worker process scanning the same tree
+    if changed or not _REPORT_LIST['version']:
+        digest = hashlib.blake2b(digest_size=8)
+        for json_file in sorted(cache):
+            mtime_ns, size = cache[json_file][0]
+            digest.update(f"{json_file}\0{mtime_ns:x}\0{size:x}\n".encode('utf-8', 'surrogateescape'))
+        _REPORT_LIST['version'] = digest.hexdigest()
+    
+    # Requests read this snapshot while later scans keep adjusting _TOTALS
+    _REPORT_LIST['totals'] = {
+        "detections": _TOTALS['detections'],
+        "severities": dict(_TOTALS['severities']),
+        "by_date": dict(_TOTALS['by_date'])
+    }
+    
     return reports
 
+def _refresh_reports():
+    """Rescan the reports tree if the listing has expired.
+    
+    The caller must hold _CACHE_LOCK.
+    """
+    now = time.monotonic()
+    if _REPORT_LIST['reports'] is None or now >= _REPORT_LIST['expires']:
+        _REPORT_LIST['reports'] = _scan_reports()
+        _REPORT_LIST['expires'] = now + REPORT_LIST_TTL
+        _REPORT_LIST['scanned'] = now
+
+def find_reports():
+    """Find all report files.
+    
+    The returned list is shared between requests and must not be modified.
+    """
+    with _CACHE_LOCK:
+        _refresh_reports()
+        return _REPORT_LIST['reports']
+
+def find_reports_versioned():
+    """Return (reports, version) from the same scan, for use as an ETag."""
+    with _CACHE_LOCK:
+        _refresh_reports()
+        return _REPORT_LIST['reports'], _REPORT_LIST['version']
+
+def report_listing():
+    """Return reports, version, totals and by_dir, all from the same scan.
+    
+    The returned values are shared between requests and must not be
+    modified.
+    """
+    with _CACHE_LOCK:
+        _refresh_reports()
+        return {key: _REPORT_LIST[key] for key in ("reports", "version", "totals", "by_dir")}
+
+def find_report_by_id(report_id):
+    """Look up a report by ID.
+    
+    An unknown ID triggers an early rescan in case the report was just
+    written, but at most once per MISS_RESCAN_INTERVAL seconds, so
+    requests for made-up IDs cannot force a tree walk each.
+    """
+    with _CACHE_LOCK:
+        _refresh_reports()
+        report = _REPORT_LIST['by_id'].get(report_id)
+        if report is None and time.monotonic() - _REPORT_LIST['scanned'] >= MISS_RESCAN_INTERVAL:
+            _REPORT_LIST['expires'] = 0.0
+            _refresh_reports()
+            report = _REPORT_LIST['by_id'].get(report_id)
+    return report
+
+def invalidate_report_cache():
+    """Force the next find_reports() call to rescan the reports tree."""
+    with _CACHE_LOCK:
+        _REPORT_LIST['expires'] = 0.0
+
 @app.route('/')
 def index():
     """Home page with API documentation."""
@@ -163,174 +420,201 @@ def index():
     # Get recent reports (last 5)
     recent_reports = reports[:5]
     
-    return render_template_string(HTML_TEMPLATE, 
+    now = datetime.now()
+    return _INDEX_TEMPLATE.render(
         api_version=API_VERSION,
         total_reports=len(reports),
         recent_reports=recent_reports,
-        today=datetime.now(),
-        generated_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        today_path=now.strftime('%Y/%m/%d'),
+        generated_time=now.strftime("%Y-%m-%d %H:%M:%S")
     )
 
 @app.route('/api/v1/reports', methods=['GET'])
 def get_all_reports():
     """Get list of all available reports."""
-    reports = find_reports()
+    reports, version = find_reports_versioned()
     
-    # Return minimal info for listing
-    report_list = []
-    for report in reports:
-        report_list.append({
-            "id": report['id'],
-            "timestamp": report['timestamp'],
-            "detections": report['detections'],
-            "severities": report['severities'],
-            "path": report['path']
-        })
-    
-    return jsonify({
-        "api_version": API_VERSION,
-        "total_reports": len(reports),
-        "reports": report_list
-    })
+    def build_payload():
+        yield json_dumps({"api_version": API_VERSION, "total_reports": len(reports)})[:-1]
+        yield b',"reports":['
+        
+        # Return minimal info for listing, encoded a slice at a time so
+        # the whole body is never held in memory at once
+        for start in range(0, len(reports), LISTING_CHUNK_SIZE):
+            chunk = [{
+                "id": report['id'],
+                "timestamp": report['timestamp'],
+                "detections": report['detections'],
+                "severities": report['severities'],
+                "path": report['path']
+            } for report in reports[start:start + LISTING_CHUNK_SIZE]]
+            encoded = json_dumps(chunk)[1:-1]
+            yield b',' + encoded if start else encoded
+        
+        yield b']}'
+    
+    return cached_json_response(version, build_payload, max_age=REPORT_LIST_TTL, stream=True)
 
 @app.route('/api/v1/reports/latest', methods=['GET'])
 def get_latest_report():
     """Get the latest report."""
-    reports = find_reports()
+    reports, version = find_reports_versioned()
     
     if not reports:
-        return jsonify({"error": "No reports found"}), 404
+        return json_response({"error": "No reports found"}, 404)
     
-    return jsonify(reports[0]['data'])
+    return cached_json_response(version, lambda: reports[0]['data'], max_age=REPORT_LIST_TTL)
 
 @app.route('/api/v1/reports/date/<year>/<month>/<day>', methods=['GET'])
 def get_reports_by_date(year, month, day):
-    """Get reports for a specific date."""
+    """Get reports for a specific date.
+    
+    Only metadata is listed; pass ?details=1 to embed each full report,
+    or fetch it from /api/v1/reports/id/<report_id>.
+    """
     date_str = f"{year}/{month}/{day}"
-    reports_dir = Path(REPORTS_BASE_DIR) / "daily" / year / month / day
+    reports_dir = os.path.join(REPORTS_BASE_DIR, "daily", year, month, day)
     
-    if not reports_dir.exists():
-        return jsonify({"error": "No reports for this date"}), 404
+    if not os.path.isdir(reports_dir):
+        return json_response({"error": "No reports for this date"}, 404)
     
-    reports = []
-    for json_file in reports_dir.glob("*.json"):
-        try:
-            with open(json_file, 'r') as f:
-                report_data = json.load(f)
-            
-            report_id = json_file.stem.replace('detection_', '').replace('report_', '')
-            
-            reports.append({
-                "id": report_id,
-                "timestamp": report_data.get('metadata', {}).get('timestamp', ''),
-                "detections": report_data.get('summary', {}).get('total_detections', 0),
-                "data": report_data
-            })
-        except Exception as e:
-            logger.warning(f"Error reading report {json_file}: {str(e)}")
-    
-    return jsonify({
-        "date": date_str,
-        "total_reports": len(reports),
-        "reports": reports
-    })
+    listing = report_listing()
+    details = request.args.get('details') == '1'
+    
+    def build_payload():
+        reports = []
+        for report in listing['by_dir'].get(reports_dir, []):
+            entry = {
+                "id": report['id'],
+                "timestamp": report['timestamp'],
+                "detections": report['detections']
+            }
+            if details:
+                entry["data"] = report['data']
+            reports.append(entry)
+        
+        return {
+            "date": date_str,
+            "total_reports": len(reports),
+            "reports": reports
+        }
+    
+    return cached_json_response(listing['version'], build_payload, max_age=REPORT_LIST_TTL)
 
 @app.route('/api/v1/reports/id/<report_id>', methods=['GET'])
 def get_report_by_id(report_id):
     """Get a specific report by ID."""
-    # Search for report file
-    for json_file in Path(REPORTS_BASE_DIR).rglob(f"*{report_id}*.json"):
-        try:
-            with open(json_file, 'r') as f:
-                report_data = json.load(f)
-            
-            return jsonify(report_data)
-        except Exception as e:
-            logger.warning(f"Error reading report {json_file}: {str(e)}")
+    report = find_report_by_id(report_id)
+    if report is None:
+        return json_response({"error": "Report not found"}, 404)
     
-    return jsonify({"error": "Report not found"}), 404
+    return cached_json_response(f"{report['mtime_ns']:x}", lambda: report['data'])
+
+def _send_report_file(path, mimetype):
+    """Send a file from the reports tree, offloading to nginx when configured."""
+    base_dir = os.path.abspath(REPORTS_BASE_DIR)
+    rel_path = os.path.relpath(path, base_dir)
+    if ACCEL_REDIRECT_PREFIX and not rel_path.startswith(os.pardir):
+        response = app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = (
+            ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(rel_path.replace(os.sep, '/'))
+        )
+        return response
+    
+    return send_file(path, mimetype=mimetype, conditional=True, etag=True)
+
+def _find_sibling(report_path, report_id, prefix, suffix):
+    """Find the rendered variant of a report written next to its JSON file."""
+    for candidate in (report_path.with_suffix(suffix),
+                      report_path.with_name(f"{prefix}_{report_id}{suffix}")):
+        if candidate.is_file():
+            return candidate
+    return None
 
 @app.route('/api/v1/reports/id/<report_id>/<format>', methods=['GET'])
 def get_report_format(report_id, format):
     """Get report in specific format."""
-    # Search for report file
-    for json_file in Path(REPORTS_BASE_DIR).rglob(f"*{report_id}*.json"):
-        try:
-            report_path = Path(json_file)
-            
-            if format == "json":
-                return send_file(str(report_path), mimetype='application/json')
-            
-            elif format == "html":
-                html_file = report_path.with_suffix('.html')
-                if html_file.exists():
-                    return send_file(str(html_file), mimetype='text/html')
-                else:
-                    return jsonify({"error": "HTML version not available"}), 404
-            
-            elif format == "markdown":
-                md_file = report_path.with_suffix('.md')
-                if md_file.exists():
-                    return send_file(str(md_file), mimetype='text/markdown')
-                else:
-                    return jsonify({"error": "Markdown version not available"}), 404
-            
-        except Exception as e:
-            logger.warning(f"Error reading report {json_file}: {str(e)}")
+    report = find_report_by_id(report_id)
+    if report is None:
+        return json_response({"error": "Report not found"}, 404)
+    
+    report_path = Path(os.path.abspath(report['path']))
+    
+    if format == "json":
+        return _send_report_file(str(report_path), 'application/json')
+    
+    elif format == "html":
+        html_file = _find_sibling(report_path, report['id'], 'report', '.html')
+        if html_file:
+            return _send_report_file(str(html_file), 'text/html')
+        else:
+            return json_response({"error": "HTML version not available"}, 404)
+    
+    elif format == "markdown":
+        md_file = _find_sibling(report_path, report['id'], 'summary', '.md')
+        if md_file:
+            return _send_report_file(str(md_file), 'text/markdown')
+        else:
+            return json_response({"error": "Markdown version not available"}, 404)
     
-    return jsonify({"error": "Report not found"}), 404
+    return json_response({"error": "Report not found"}, 404)
 
 @app.route('/api/v1/summary', methods=['GET'])
 def get_summary():
     """Get summary statistics."""
-    reports = find_reports()
+    listing = report_listing()
+    reports = listing['reports']
     
     if not reports:
-        return jsonify({"error": "No reports found"}), 404
-    
-    # Calculate statistics
-    total_detections = sum(r['detections'] for r in reports)
-    
-    severity_totals = {}
-    for report in reports:
-        for severity, count in report['severities'].items():
-            severity_totals[severity] = severity_totals.get(severity, 0) + count
+        return json_response({"error": "No reports found"}, 404)
     
-    # Group by date
-    from collections import defaultdict
-    reports_by_date = defaultdict(list)
-    for report in reports:
-        if report['timestamp']:
-            date = report['timestamp'][:10]  # YYYY-MM-DD
-            reports_by_date[date].append(report)
+    totals = listing['totals']
+    total_detections = totals['detections']
     
-    return jsonify({
+    return cached_json_response(listing['version'], lambda: {
         "api_version": API_VERSION,
         "statistics": {
             "total_reports": len(reports),
             "total_detections": total_detections,
             "average_detections_per_report": total_detections / len(reports) if reports else 0,
-            "severity_distribution": severity_totals,
-            "reports_by_date": {k: len(v) for k, v in reports_by_date.items()}
+            "severity_distribution": totals['severities'],
+            "reports_by_date": totals['by_date']
         },
         "time_range": {
             "first_report": reports[-1]['timestamp'] if reports else None,
             "last_report": reports[0]['timestamp'] if reports else None
         }
-    })
+    }, max_age=REPORT_LIST_TTL)
+
+@app.route('/api/v1/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """Drop the cached report listing so new reports show up immediately."""
+    invalidate_report_cache()
+    return json_response({"status": "invalidated"})
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
-    return jsonify({
+    return json_response({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "reports_count": len(find_reports())
     })
 
-if __name__ == '__main__':
+def create_app():
+    """Prepare the app for serving and warm the report cache.
+    
+    In production run it under gunicorn with --preload, e.g.
+    `gunicorn --preload -w 4 -k gthread --threads 4 'report_api:create_app()'`,
+    so the cache is built once in the master and shared with the forked
+    workers.
+    """
     # Ensure reports directory exists
     os.makedirs(REPORTS_BASE_DIR, exist_ok=True)
     
-    # Run the Flask app
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    find_reports()
+    return app
+
+if __name__ == '__main__':
+    # Development server; see create_app() for running under gunicorn
+    create_app().run(host='0.0.0.0', port=8080, threaded=True)
@@ -9,12 +9,24 @@ import sys
 import random
 import json
 import time
+import shutil
 import subprocess
 import logging
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 from faker import Faker
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from pystemd.systemd1 import Unit as SystemdUnit
+except ImportError:
+    SystemdUnit = None
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,11 +38,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def json_line(obj):
+    """Encode obj as one newline-terminated JSON line (bytes), using orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj) + '\n').encode('utf-8')
+
+def build_alias_table(weights):
+    """Build Vose alias tables (prob, alias) for O(1) weighted sampling."""
+    n = len(weights)
+    total = float(sum(weights))
+    scaled = [w * n / total for w in weights]
+    prob = [1.0] * n
+    alias = list(range(n))
+    
+    small = deque(i for i, q in enumerate(scaled) if q < 1.0)
+    large = deque(i for i, q in enumerate(scaled) if q >= 1.0)
+    while small and large:
+        s, l = small.popleft(), large.popleft()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        (small if scaled[l] < 1.0 else large).append(l)
+    
+    # Whatever is left over is 1.0 up to rounding error
+    return prob, alias
+
 class DriftSimulator:
     def __init__(self):
         self.fake = Faker()
         self.drift_log = []
         self.simulation_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._hostname = os.uname().nodename
+        
+        # Drift events are appended to one handle kept open for the
+        # simulator's lifetime; unbuffered, so each event is one write
+        self._log_fh = open(f"logs/drift_{self.simulation_id}.json", 'ab', buffering=0)
+        
+        # "YYYY-MM-DDTHH:MM:SS" of the last whole second an event was logged in
+        self._ts_second = None
+        self._ts_prefix = ""
         
         # Define drift scenarios with weights (higher = more likely)
         self.drift_scenarios = [
@@ -44,6 +91,7 @@ class DriftSimulator:
             {"name": "change_firewall_rule", "weight": 5, "func": self.change_firewall_rule},
             {"name": "no_drift", "weight": 5, "func": self.no_drift}  # Sometimes do nothing
         ]
+        self._alias_prob, self._alias = build_alias_table([s["weight"] for s in self.drift_scenarios])
         
         # Target paths that are managed by Ansible
         self.managed_paths = [
@@ -57,39 +105,91 @@ class DriftSimulator:
         # Services managed by Ansible
         self.managed_services = ["nginx", "apache2", "httpd", "ssh", "cron"]
     
+    @staticmethod
+    def _iter_files(path, suffixes=None):
+        """Yield every file below path, optionally only those ending in suffixes.
+        
+        Names are filtered on the scandir entry before any path is built.
+        Like os.walk, symlinked directories are not descended into.
+        """
+        stack = [path]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir():
+                                if not entry.is_symlink():
+                                    stack.append(entry.path)
+                            elif suffixes is None or entry.name.endswith(suffixes):
+                                yield entry.path
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+    
+    def _choose_file(self, path, suffixes=None):
+        """Pick one file below path uniformly at random, or None if there are none.
+        
+        Single-slot reservoir sampling: the tree is walked once and never
+        collected into a list.
+        """
+        chosen = None
+        for n, file_path in enumerate(self._iter_files(path, suffixes), 1):
+            if random.randrange(n) == 0:
+                chosen = file_path
+        return chosen
+    
     def weighted_random_choice(self, scenarios):
-        """Select a scenario based on weights."""
-        total = sum(s["weight"] for s in scenarios)
-        r = random.uniform(0, total)
-        upto = 0
-        for scenario in scenarios:
-            if upto + scenario["weight"] >= r:
-                return scenario
-            upto += scenario["weight"]
-        return scenarios[0]
+        """Select a scenario based on weights, in constant time."""
+        if scenarios is self.drift_scenarios:
+            prob, alias = self._alias_prob, self._alias
+        else:
+            prob, alias = build_alias_table([s["weight"] for s in scenarios])
+        
+        i = random.randrange(len(scenarios))
+        return scenarios[i] if random.random() < prob[i] else scenarios[alias[i]]
+    
+    def _timestamp(self):
+        """Return the local time in datetime.isoformat() form.
+        
+        The date and time up to the second are only formatted when the
+        second changes; events within the same second just append the
+        microseconds. Both come from one integer clock reading, rounded
+        to the microsecond.
+        """
+        second, microsecond = divmod((time.time_ns() + 500) // 1000, 1_000_000)
+        if second != self._ts_second:
+            self._ts_second = second
+            self._ts_prefix = datetime.fromtimestamp(second).strftime("%Y-%m-%dT%H:%M:%S")
+        
+        return f"{self._ts_prefix}.{microsecond:06d}" if microsecond else self._ts_prefix
     
     def log_drift(self, action, target, details, severity="medium"):
         """Log a drift event."""
         drift_event = {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": self._timestamp(),
             "simulation_id": self.simulation_id,
             "action": action,
             "target": target,
             "details": details,
             "severity": severity,
-            "hostname": os.uname().nodename
+            "hostname": self._hostname
         }
         
         self.drift_log.append(drift_event)
         logger.info(f"DRIFT: {action} on {target} - {details}")
         
         # Save to individual log file
-        log_file = f"logs/drift_{self.simulation_id}.json"
-        with open(log_file, 'a') as f:
-            f.write(json.dumps(drift_event) + '\n')
+        self._log_fh.write(json_line(drift_event))
         
         return drift_event
     
+    def close(self):
+        """Close the drift log file."""
+        if not self._log_fh.closed:
+            self._log_fh.close()
+    
     def modify_web_content(self):
         """Modify web content (index.html or other files)."""
         web_roots = [
@@ -102,10 +202,6 @@ class DriftSimulator:
             if os.path.exists(web_root):
                 index_file = os.path.join(web_root, "index.html")
                 if os.path.exists(index_file):
-                    # Read current content
-                    with open(index_file, 'r') as f:
-                        content = f.read()
-                    
                     # Add a random "hacker" message
                     hacker_messages = [
                         "<!-- HACKED BY DRIFT SIMULATOR -->",
@@ -113,18 +209,31 @@ class DriftSimulator:
                         "<script>console.log('Unauthorized change detected!')</script>",
                         "<!-- System compromised for testing purposes -->"
                     ]
+                    message = random.choice(hacker_messages).encode('utf-8')
                     
-                    insert_point = random.randint(0, len(content) // 2)
-                    new_content = content[:insert_point] + random.choice(hacker_messages) + content[insert_point:]
-                    
-                    # Backup original
+                    # Backup original (copyfile uses the kernel's copy fast paths)
                     backup_file = f"{index_file}.bak.{self.simulation_id}"
-                    with open(backup_file, 'w') as f:
-                        f.write(content)
+                    shutil.copyfile(index_file, backup_file)
                     
-                    # Write modified content
-                    with open(index_file, 'w') as f:
-                        f.write(new_content)
+                    # Insert in place: only the bytes after the insertion
+                    # point are read and shifted, the prefix is untouched
+                    fd = os.open(index_file, os.O_RDWR)
+                    try:
+                        size = os.fstat(fd).st_size
+                        insert_point = random.randint(0, size // 2)
+                        suffix = os.pread(fd, size - insert_point, insert_point)
+                        
+                        # Never split a UTF-8 sequence
+                        skip = 0
+                        while skip < len(suffix) and suffix[skip] & 0xC0 == 0x80:
+                            skip += 1
+                        insert_point += skip
+                        suffix = memoryview(suffix)[skip:]
+                        
+                        os.pwrite(fd, message, insert_point)
+                        os.pwrite(fd, suffix, insert_point + len(message))
+                    finally:
+                        os.close(fd)
                     
                     return self.log_drift(
                         "modify_web_content",
@@ -135,19 +244,35 @@ class DriftSimulator:
         
         return self.log_drift("modify_web_content", "N/A", "No web content found to modify", "low")
     
+    @staticmethod
+    def _is_service_active(service):
+        """Return whether a systemd service is active.
+        
+        Asks systemd over D-Bus through pystemd when it is installed, and
+        falls back to forking `systemctl is-active`.
+        """
+        if SystemdUnit is not None:
+            try:
+                unit = SystemdUnit(f"{service}.service".encode())
+                unit.load()
+                return unit.Unit.ActiveState == b"active"
+            except Exception as e:
+                logger.debug(f"pystemd lookup of {service} failed: {str(e)}")
+        
+        result = subprocess.run(
+            ["systemctl", "is-active", service],
+            capture_output=True,
+            text=True
+        )
+        return result.stdout.strip() == "active"
+    
     def stop_service(self):
         """Stop a managed service."""
         service = random.choice(self.managed_services)
         
         try:
             # Check if service exists and is running
-            result = subprocess.run(
-                ["systemctl", "is-active", service],
-                capture_output=True,
-                text=True
-            )
-            
-            if result.stdout.strip() == "active":
+            if self._is_service_active(service):
                 subprocess.run(["sudo", "systemctl", "stop", service], check=True)
                 
                 return self.log_drift(
@@ -176,15 +301,10 @@ class DriftSimulator:
         """Delete a managed configuration file."""
         for path in self.managed_paths:
             if os.path.exists(path):
-                # Find all files in the path
-                files = []
-                for root, dirs, filenames in os.walk(path):
-                    for filename in filenames:
-                        if filename.endswith(('.conf', '.json', '.yml', '.yaml')):
-                            files.append(os.path.join(root, filename))
+                # Pick one of the configuration files in the path
+                file_to_delete = self._choose_file(path, ('.conf', '.json', '.yml', '.yaml'))
                 
-                if files:
-                    file_to_delete = random.choice(files)
+                if file_to_delete:
                     
                     # Create backup before deletion
                     backup_file = f"{file_to_delete}.bak.{self.simulation_id}"
@@ -223,8 +343,9 @@ class DriftSimulator:
                 # Set a random password
                 password = self.fake.password()
                 subprocess.run(
-                    f"echo '{username}:{password}' | sudo chpasswd",
-                    shell=True,
+                    ["sudo", "chpasswd"],
+                    input=f"{username}:{password}\n",
+                    text=True,
                     check=True
                 )
                 
@@ -254,14 +375,10 @@ class DriftSimulator:
         """Change permissions on managed files."""
         for path in self.managed_paths:
             if os.path.exists(path):
-                # Find files to modify
-                files = []
-                for root, dirs, filenames in os.walk(path):
-                    for filename in filenames:
-                        files.append(os.path.join(root, filename))
+                # Pick a file to modify
+                file_to_modify = self._choose_file(path)
                 
-                if files:
-                    file_to_modify = random.choice(files)
+                if file_to_modify:
                     current_mode = oct(os.stat(file_to_modify).st_mode)[-3:]
                     
                     # Choose a problematic permission
@@ -332,57 +449,50 @@ class DriftSimulator:
         
         package = random.choice(packages)
         
+        # Installing is idempotent, so let the package manager report
+        # whether the package was already there instead of probing first
+        if shutil.which("apt-get"):
+            manager = "apt"
+            command = ["sudo", "apt-get", "install", "-y", "--no-install-recommends", package]
+            already_marker = "is already the newest version"
+        else:
+            manager = "yum"
+            command = ["sudo", "yum", "install", "-y", package]
+            already_marker = "already installed"
+        
         try:
-            # Check if package is already installed
-            result = subprocess.run(
-                ["which", package],
-                capture_output=True,
-                text=True
-            )
-            
-            if result.returncode != 0:
-                # Try to install
-                subprocess.run(
-                    ["sudo", "apt", "install", "-y", package],
-                    capture_output=True,
-                    text=True
-                )
-                
-                return self.log_drift(
-                    "install_unauthorized_package",
-                    package,
-                    f"Installed unauthorized package: {package}",
-                    "medium"
-                )
-            else:
-                return self.log_drift(
-                    "install_unauthorized_package",
-                    package,
-                    f"Package {package} already installed",
-                    "low"
-                )
-                
+            result = subprocess.run(command, capture_output=True, text=True)
         except Exception as e:
-            # Try with yum/dnf for Rocky
-            try:
-                subprocess.run(
-                    ["sudo", "yum", "install", "-y", package],
-                    capture_output=True,
-                    text=True
-                )
-                return self.log_drift(
-                    "install_unauthorized_package",
-                    package,
-                    f"Installed unauthorized package via yum: {package}",
-                    "medium"
-                )
-            except:
-                return self.log_drift(
-                    "install_unauthorized_package",
-                    package,
-                    f"Failed to install {package}: {str(e)}",
-                    "low"
-                )
+            return self.log_drift(
+                "install_unauthorized_package",
+                package,
+                f"Failed to install {package}: {str(e)}",
+                "low"
+            )
+        
+        if result.returncode != 0:
+            return self.log_drift(
+                "install_unauthorized_package",
+                package,
+                f"Failed to install {package}: {result.stderr.strip()[:200]}",
+                "low"
+            )
+        
+        if already_marker in result.stdout:
+            return self.log_drift(
+                "install_unauthorized_package",
+                package,
+                f"Package {package} already installed",
+                "low"
+            )
+        
+        via = "" if manager == "apt" else f" via {manager}"
+        return self.log_drift(
+            "install_unauthorized_package",
+            package,
+            f"Installed unauthorized package{via}: {package}",
+            "medium"
+        )
     
     def change_firewall_rule(self):
         """Add or remove a firewall rule."""
@@ -504,6 +614,8 @@ def main():
     except Exception as e:
         logger.error(f"Simulation failed: {str(e)}")
         return 1
+    finally:
+        simulator.close()
 
 if __name__ == "__main__":
     sys.exit(main())
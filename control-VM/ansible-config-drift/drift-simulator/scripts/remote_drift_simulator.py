@@ -7,12 +7,49 @@ import paramiko
 import yaml
 import random
 import json
+import re
+import uuid
+import fnmatch
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def json_dumps_indented(obj):
+    """Encode obj as 2-space indented JSON bytes, using orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode('utf-8')
+
+# Connections shared by every simulator in the process, keyed by
+# (host, user), so repeated simulations skip the SSH handshake
+_SSH_CLIENTS = {}
+
+# SFTP sessions opened on those connections, under the same keys
+_SFTP_CLIENTS = {}
+
+# `echo '<line>' >> <path>` drifts, which are applied over SFTP instead
+# of through a remote shell
+APPEND_COMMAND = re.compile(r"^echo '([^']*)' >> (\S+)$")
+
+def close_ssh_clients():
+    """Close all cached SFTP sessions and SSH connections."""
+    for sftp in _SFTP_CLIENTS.values():
+        sftp.close()
+    _SFTP_CLIENTS.clear()
+    for ssh in _SSH_CLIENTS.values():
+        ssh.close()
+    _SSH_CLIENTS.clear()
+
 class RemoteDriftSimulator:
     def __init__(self, config_path):
         with open(config_path, 'r') as f:
@@ -20,9 +57,18 @@ class RemoteDriftSimulator:
         
         self.ssh_clients = {}
         self.results = []
+        # Nodes are driven from worker threads that all append to results
+        self._results_lock = threading.Lock()
     
     def connect_to_node(self, node):
-        """Establish SSH connection to a node."""
+        """Establish SSH connection to a node, reusing a live cached one."""
+        key = (node['ip'], 'vagrant')
+        ssh = _SSH_CLIENTS.get(key)
+        transport = ssh.get_transport() if ssh else None
+        if transport is not None and transport.is_active():
+            self.ssh_clients[node['name']] = ssh
+            return True
+        
         try:
             ssh = paramiko.SSHClient()
             ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -30,9 +76,15 @@ class RemoteDriftSimulator:
             ssh.connect(
                 hostname=node['ip'],
                 username='vagrant',
-                key_filename=self.config['remote_execution']['ssh_key_path']
+                key_filename=self.config['remote_execution']['ssh_key_path'],
+                compress=True,
+                banner_timeout=5,
+                auth_timeout=5
             )
+            # Keep idle connections from being dropped between simulations
+            ssh.get_transport().set_keepalive(30)
             
+            _SSH_CLIENTS[key] = ssh
             self.ssh_clients[node['name']] = ssh
             logger.info(f"Connected to {node['name']} ({node['ip']})")
             return True
@@ -41,49 +93,161 @@ class RemoteDriftSimulator:
             logger.error(f"Failed to connect to {node['name']}: {str(e)}")
             return False
     
+    def get_sftp(self, node):
+        """Return an SFTP session on the node's connection, opening it on first use."""
+        key = (node['ip'], 'vagrant')
+        sftp = _SFTP_CLIENTS.get(key)
+        if sftp is None or sftp.get_channel().closed:
+            sftp = self.ssh_clients[node['name']].open_sftp()
+            _SFTP_CLIENTS[key] = sftp
+        return sftp
+    
+    @staticmethod
+    def _expand_remote_glob(sftp, pattern):
+        """Expand shell wildcards in an absolute remote path via SFTP listings."""
+        paths = ['/']
+        for part in pattern.strip('/').split('/'):
+            if not any(c in part for c in '*?['):
+                paths = [posixpath.join(path, part) for path in paths]
+                continue
+            
+            matches = []
+            for path in paths:
+                try:
+                    names = sftp.listdir(path)
+                except IOError:
+                    continue
+                matches.extend(posixpath.join(path, name)
+                               for name in sorted(fnmatch.filter(names, part)))
+            paths = matches
+        return paths
+    
+    def _record_result(self, node, command, exit_code, output, error):
+        result = {
+            'node': node['name'],
+            'command': command,
+            'exit_code': exit_code,
+            'output': output,
+            'error': error,
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        with self._results_lock:
+            self.results.append(result)
+        
+        if exit_code == 0:
+            logger.info(f"Drift executed on {node['name']}: {command[:50]}...")
+        else:
+            logger.warning(f"Drift failed on {node['name']}: {error[:100]}")
+        
+        return result
+    
+    def append_remote(self, node, command, line, pattern):
+        """Append a line to every remote file matching pattern over SFTP.
+        
+        Equivalent to `echo '<line>' >> <pattern>` without a remote shell.
+        """
+        try:
+            sftp = self.get_sftp(node)
+            
+            # Like the shell, an unmatched pattern is taken literally
+            paths = self._expand_remote_glob(sftp, pattern) or [pattern]
+            data = f"{line}\n".encode()
+            
+            errors = []
+            for path in paths:
+                try:
+                    with sftp.open(path, 'a') as f:
+                        f.write(data)
+                except IOError as e:
+                    errors.append(f"{path}: {str(e)}")
+            
+            return self._record_result(node, command, 1 if errors else 0, '', "\n".join(errors))
+            
+        except Exception as e:
+            logger.error(f"Failed to execute drift on {node['name']}: {str(e)}")
+            return None
+    
     def execute_drift(self, node, command):
         """Execute a drift command on remote node."""
+        results = self.execute_drifts(node, [command])
+        return results[0] if results else None
+    
+    def execute_drifts(self, node, commands):
+        """Execute several drift commands on a remote node over one channel.
+        
+        File appends are written over SFTP. The remaining commands run in
+        a single remote shell, each followed by a sentinel carrying its
+        exit code, so one exec_command replaces a channel and shell per
+        command. Returns one result per command that ran.
+        """
+        results = []
+        shell_commands = []
+        for command in commands:
+            match = APPEND_COMMAND.match(command)
+            if match:
+                result = self.append_remote(node, command, *match.groups())
+                if result is not None:
+                    results.append(result)
+            else:
+                shell_commands.append(command)
+        
+        if shell_commands:
+            results.extend(self._execute_shell(node, shell_commands))
+        return results
+    
+    def _execute_shell(self, node, commands):
+        """Run commands in one remote shell and return one result per command."""
         try:
             ssh = self.ssh_clients[node['name']]
             
             # Add sudo if needed
-            if not command.startswith('echo'):
-                command = f"sudo {command}"
+            commands = [command if command.startswith('echo') else f"sudo {command}"
+                        for command in commands]
             
-            stdin, stdout, stderr = ssh.exec_command(command)
-            exit_code = stdout.channel.recv_exit_status()
+            sentinel = f"__DRIFT_SEP_{uuid.uuid4().hex}__"
+            script = "\n".join(
+                f'{command}\nrc=$?; echo "{sentinel} $rc"; echo "{sentinel}" >&2'
+                for command in commands
+            )
+            
+            stdin, stdout, stderr = ssh.exec_command(script)
+            stdout.channel.recv_exit_status()
             output = stdout.read().decode()
             error = stderr.read().decode()
             
-            result = {
-                'node': node['name'],
-                'command': command,
-                'exit_code': exit_code,
-                'output': output,
-                'error': error,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            self.results.append(result)
+            # [out0, rc0, out1, rc1, ..., trailing]
+            out_parts = re.split(rf"{sentinel} (\d+)\n", output)
+            err_parts = error.split(f"{sentinel}\n")
             
-            if exit_code == 0:
-                logger.info(f"Drift executed on {node['name']}: {command[:50]}...")
-            else:
-                logger.warning(f"Drift failed on {node['name']}: {error[:100]}")
+            results = []
+            for i, command in enumerate(commands):
+                if 2 * i + 1 < len(out_parts):
+                    command_output = out_parts[2 * i]
+                    exit_code = int(out_parts[2 * i + 1])
+                else:
+                    # The shell died before reaching this command's sentinel
+                    command_output = out_parts[-1] if 2 * i == len(out_parts) - 1 else ''
+                    exit_code = -1
+                command_error = err_parts[i] if i < len(err_parts) else ''
+                
+                results.append(self._record_result(
+                    node, command, exit_code, command_output, command_error))
             
-            return result
+            return results
             
         except Exception as e:
             logger.error(f"Failed to execute drift on {node['name']}: {str(e)}")
-            return None
+            return []
     
     def simulate_remote_drifts(self):
         """Simulate drifts on remote nodes."""
         logger.info("Starting remote drift simulation...")
         
-        # Connect to all nodes
-        for node in self.config['simulator']['target_nodes']:
-            self.connect_to_node(node)
+        # Connect to all nodes; handshakes to different nodes overlap
+        target_nodes = self.config['simulator']['target_nodes']
+        with ThreadPoolExecutor(max_workers=max(1, len(target_nodes))) as executor:
+            list(executor.map(self.connect_to_node, target_nodes))
         
         # Define remote drift commands
         drift_commands = [
@@ -112,32 +276,44 @@ class RemoteDriftSimulator:
             "echo '# UNAUTHORIZED CHANGE' >> /etc/ssh/sshd_config"
         ]
         
-        # Execute random drifts on random nodes
+        # Execute random drifts on random nodes, batched per node
         num_drifts = random.randint(1, 3)
         
+        per_node = {}
         for _ in range(num_drifts):
             node = random.choice(self.config['simulator']['target_nodes'])
             command = random.choice(drift_commands)
             
             if node['name'] in self.ssh_clients:
-                self.execute_drift(node, command)
+                per_node.setdefault(node['name'], (node, []))[1].append(command)
+        
+        # Nodes are independent, so run their batches concurrently
+        if per_node:
+            with ThreadPoolExecutor(max_workers=len(per_node)) as executor:
+                futures = {executor.submit(self.execute_drifts, node, commands): node
+                           for node, commands in per_node.values()}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"Drift batch failed on {futures[future]['name']}: {str(e)}")
         
         # Save results
         results_file = f"logs/remote_drifts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(results_file, 'w') as f:
-            json.dump(self.results, f, indent=2)
+        with open(results_file, 'wb') as f:
+            f.write(json_dumps_indented(self.results))
         
         logger.info(f"Remote drift simulation complete. Results saved to {results_file}")
         
-        # Close connections
-        for ssh in self.ssh_clients.values():
-            ssh.close()
-        
+        # Connections stay open for the next simulation; see close_ssh_clients()
         return self.results
 
 if __name__ == "__main__":
     simulator = RemoteDriftSimulator("configs/simulator_config.yaml")
-    results = simulator.simulate_remote_drifts()
+    try:
+        results = simulator.simulate_remote_drifts()
+    finally:
+        close_ssh_clients()
     
     print("\nRemote Drift Simulation Results:")
     print("="*60)
@@ -5,16 +5,39 @@ Safely remediates configuration drifts with canary deployment and rollback.
 """
 
 import os
+import re
+import posixpath
 import sys
 import json
 import yaml
+import copy
 import logging
 import shutil
+import atexit
+import signal
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 import subprocess
 import time
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,43 +49,187 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# events.json is written through one buffered handle; it is flushed every
+# EVENT_FLUSH_COUNT events, or EVENT_FLUSH_INTERVAL seconds after the
+# first unflushed event, whichever comes first
+EVENT_BUFFER_SIZE = 64 * 1024
+EVENT_FLUSH_COUNT = 50
+EVENT_FLUSH_INTERVAL = 0.2
+
+# Seconds a service state or host check result may be reused, e.g. by
+# repeated validations; any remediation on the host discards them
+VALIDATION_CACHE_TTL = 5.0
+
+# Configuration trees saved before remediation and restored on rollback
+BACKUP_PATHS = [
+    "/etc/nginx",
+    "/etc/apache2",
+    "/etc/httpd",
+    "/var/www",
+    "/etc/ansible-managed"
+]
+
+# Backups are taken with rsync when it is installed, hardlinking files
+# unchanged since the node's previous backup
+RSYNC = shutil.which("rsync")
+
+# Directories whose files the engine may restore, unless overridden by
+# strategies.file_integrity.managed_dirs
+MANAGED_DIRS = ["/var/www", "/etc/nginx", "/etc/apache2", "/etc/httpd", "/etc/ansible-managed"]
+
+# Suffix of backup directory names, "<node>_<remediation_id>"
+BACKUP_ID_SUFFIX = re.compile(r"_\d{8}_\d{6}")
+
+def json_loads(data):
+    """Parse JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_line(obj):
+    """Encode obj as one newline-terminated JSON line (bytes), using orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj) + '\n').encode('utf-8')
+
+def json_dumps_indented(obj):
+    """Encode obj as 2-space indented JSON bytes, using orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode('utf-8')
+
+def ansible_env(config_path=None):
+    """Environment for ansible-playbook runs.
+    
+    Points Ansible at the project's ansible.cfg, which holds the SSH
+    connection settings, unless the caller already set ANSIBLE_CONFIG.
+    """
+    env = os.environ.copy()
+    if config_path:
+        env.setdefault("ANSIBLE_CONFIG", os.path.abspath(config_path))
+    return env
+
 class RemediationEngine:
+    # Parsed configs keyed by (absolute path, mtime_ns), shared by all
+    # engines in the process
+    _config_cache = {}
+    
     def __init__(self, config_path):
         """Initialize remediation engine."""
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config = self._load_config(config_path)
         
         self.remediation_id = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.remediation_log = []
+        # Running count of remediation_log entries per event type
+        self._event_counts = Counter()
         self.canary_nodes = []
         self.remediated_nodes = []
         self.failed_nodes = []
+        # Nodes are remediated from worker threads that share the lists above
+        self._state_lock = threading.Lock()
+        
+        # Set to end the canary wait early; see skip_canary_wait()
+        self._skip_wait = threading.Event()
+        
+        # Validation results per validation type, written out together
+        # by write_validation_results()
+        self._validation_buf = {}
+        
+        # Latest backup directory per (backup_type, node)
+        self._last_backup = {}
+        
+        # Last ActiveState read from systemctl, and when it was read
+        # (time.monotonic()), per service; remediating a service drops it.
+        # Guarded by _service_lock, as nodes validate from worker threads
+        self._service_state_cache = {}
+        self._service_state_checked = {}
+        self._service_lock = threading.Lock()
+        
+        # (checked_at, output line) per host check command; cleared with
+        # the service states by _forget_host_state()
+        self._host_check_cache = {}
+        
+        # Managed directories as normalized paths; see _is_managed()
+        managed_dirs = self.config['strategies']['file_integrity'].get('managed_dirs', MANAGED_DIRS)
+        self._managed_dirs = frozenset(posixpath.normpath(d) for d in managed_dirs)
+        
+        # Drift type -> handler(node, drift) returning success
+        self._handlers = {
+            'service_status_change': self._remediate_service_drift,
+            'user_added': self._remediate_user_drift,
+            'user_removed': self._remediate_user_drift,
+        }
+        # Drift type -> handler(node, drifts) returning one success per
+        # drift, for kinds remediated together in one operation; they run
+        # in this order, before the handlers above
+        self._bulk_handlers = {
+            'file_change': self.remediate_file_changes_bulk,
+            'package_added': self._remediate_package_drifts,
+            'package_removed': self._remediate_package_drifts,
+        }
+        
+        # Package manager available on this host, if any
+        self._pkg_mgr = next((m for m in ("apt-get", "dnf", "yum") if shutil.which(m)), None)
         
         # Create remediation directory
         self.remediation_dir = f"remediations/{self.remediation_id}"
         os.makedirs(self.remediation_dir, exist_ok=True)
         
-        # Load detection report if available
-        self.detection_report = self.load_latest_detection()
+        # Event log handle, kept open for the engine's lifetime
+        self._event_fp = open(f"{self.remediation_dir}/events.json", 'ab', buffering=EVENT_BUFFER_SIZE)
+        self._event_lock = threading.Lock()
+        self._events_since_flush = 0
+        self._flush_timer = None
+        atexit.register(self.close)
+        
+        # Locate detection report if available; detections are read
+        # from it lazily by iter_detections()
+        self.detection_report_path = self.find_latest_detection()
     
-    def load_latest_detection(self):
-        """Load latest detection report."""
+    @classmethod
+    def _load_config(cls, config_path):
+        """Load a YAML config, parsing it only when the file has changed.
+        
+        Each engine gets its own copy, since callers adjust it (e.g.
+        --safe-mode).
+        """
+        key = (os.path.abspath(config_path), os.stat(config_path).st_mtime_ns)
+        config = cls._config_cache.get(key)
+        if config is None:
+            with open(config_path, 'r') as f:
+                config = yaml.load(f, Loader=SafeLoader)
+            cls._config_cache[key] = config
+        return copy.deepcopy(config)
+    
+    def find_latest_detection(self):
+        """Return the path of the latest detection report."""
         reports_path = self.config['integration']['detection_system']['reports_path']
         
-        # Find latest report
-        json_files = list(Path(reports_path).rglob("*.json"))
+        # The detection system keeps latest.json pointing at its newest report
+        latest_link = os.path.join(reports_path, "latest.json")
+        if os.path.exists(latest_link):
+            return latest_link
+        
+        # Otherwise find latest report
+        json_files = [path for path in Path(reports_path).rglob("*.json")
+                      if path != Path(latest_link)]
         if not json_files:
             logger.warning("No detection reports found")
             return None
         
-        latest_report = max(json_files, key=os.path.getctime)
+        return max(json_files, key=os.path.getctime)
+    
+    def iter_detections(self):
+        """Yield the detections of the latest report one at a time.
         
-        try:
-            with open(latest_report, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Failed to load detection report: {str(e)}")
-            return None
+        With ijson installed the report is parsed incrementally, so only
+        one detection is in memory at once; otherwise it is loaded whole.
+        """
+        with open(self.detection_report_path, 'rb') as f:
+            if ijson is not None:
+                yield from ijson.items(f, 'detections.item', use_float=True)
+            else:
+                yield from json_loads(f.read()).get('detections', [])
     
     def log_event(self, event_type, node, details, status="info"):
         """Log a remediation event."""
@@ -75,12 +242,18 @@ class RemediationEngine:
             "status": status
         }
         
-        self.remediation_log.append(event)
-        
         # Write to log file
-        log_file = f"{self.remediation_dir}/events.json"
-        with open(log_file, 'a') as f:
-            f.write(json.dumps(event) + '\n')
+        with self._event_lock:
+            self.remediation_log.append(event)
+            self._event_counts[event_type] += 1
+            self._event_fp.write(json_line(event))
+            self._events_since_flush += 1
+            if self._events_since_flush >= EVENT_FLUSH_COUNT:
+                self._flush_events_locked()
+            elif self._flush_timer is None:
+                self._flush_timer = threading.Timer(EVENT_FLUSH_INTERVAL, self.flush_events)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
         
         # Log to console based on status
         if status == "error":
@@ -92,6 +265,26 @@ class RemediationEngine:
         
         return event
     
+    def _flush_events_locked(self):
+        """Flush buffered events to disk; the caller holds _event_lock."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._events_since_flush and not self._event_fp.closed:
+            self._event_fp.flush()
+        self._events_since_flush = 0
+    
+    def flush_events(self):
+        """Flush buffered events to events.json."""
+        with self._event_lock:
+            self._flush_events_locked()
+    
+    def close(self):
+        """Flush and close the event log."""
+        with self._event_lock:
+            self._flush_events_locked()
+            self._event_fp.close()
+    
     def select_canary_nodes(self, all_nodes):
         """Select canary nodes for initial remediation."""
         if not self.config['remediation']['canary']['enabled']:
@@ -106,27 +299,52 @@ class RemediationEngine:
         logger.info(f"Selected {len(canary_nodes)} canary nodes: {', '.join(canary_nodes)}")
         return canary_nodes
     
+    def _previous_backup(self, node, backup_type):
+        """Return the node's most recent earlier backup directory, if any."""
+        previous = self._last_backup.get((backup_type, node))
+        if previous:
+            return previous
+        
+        try:
+            entries = os.scandir(f"backups/{backup_type}")
+        except FileNotFoundError:
+            return None
+        
+        with entries:
+            names = [entry.name for entry in entries
+                     if entry.name.startswith(f"{node}_")
+                     and BACKUP_ID_SUFFIX.fullmatch(entry.name[len(node):])
+                     and entry.name != f"{node}_{self.remediation_id}"
+                     and entry.is_dir()]
+        
+        # Remediation IDs are timestamps, so the newest sorts last
+        return os.path.abspath(f"backups/{backup_type}/{max(names)}") if names else None
+    
     def create_backup(self, node, backup_type="pre_remediation"):
         """Create backup of node configuration."""
         backup_dir = f"backups/{backup_type}/{node}_{self.remediation_id}"
         os.makedirs(backup_dir, exist_ok=True)
         
         try:
-            # Backup key configuration files
-            backup_paths = [
-                "/etc/nginx",
-                "/etc/apache2",
-                "/etc/httpd",
-                "/var/www",
-                "/etc/ansible-managed"
-            ]
+            previous_backup = self._previous_backup(node, backup_type)
             
-            for path in backup_paths:
-                if os.path.exists(path):
-                    # Use rsync for efficient backup
+            # Backup key configuration files
+            if RSYNC:
+                # One rsync for every tree: "/./" keeps each tree's full
+                # path under the backup, and trees this host lacks are
+                # skipped without probing for them first
+                cmd = [RSYNC, "-a", "--relative", "--ignore-missing-args"]
+                if previous_backup:
+                    cmd.append(f"--link-dest={previous_backup}")
+                subprocess.run(cmd + [f"/.{path}" for path in BACKUP_PATHS] + [f"{backup_dir}/"],
+                               check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            else:
+                for path in BACKUP_PATHS:
                     dest_path = os.path.join(backup_dir, path.lstrip('/'))
-                    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                    shutil.copytree(path, dest_path, dirs_exist_ok=True)
+                    try:
+                        shutil.copytree(path, dest_path, dirs_exist_ok=True)
+                    except FileNotFoundError:
+                        continue
             
             # Backup service status
             services_file = os.path.join(backup_dir, "services.status")
@@ -134,13 +352,95 @@ class RemediationEngine:
                 subprocess.run(["systemctl", "list-units", "--type=service", "--state=running"], 
                              stdout=f, stderr=subprocess.DEVNULL)
             
+            self._last_backup[(backup_type, node)] = os.path.abspath(backup_dir)
             self.log_event("backup_created", node, f"Backup saved to {backup_dir}")
             return backup_dir
             
+        except subprocess.CalledProcessError as e:
+            self.log_event("backup_failed", node, f"{str(e)} {(e.stderr or '').strip()}", "error")
+            return None
         except Exception as e:
             self.log_event("backup_failed", node, str(e), "error")
             return None
     
+    def _refresh_service_states(self, services, max_age=None):
+        """Read the ActiveState of services with one systemctl call.
+        
+        Updates the service state cache and returns {service: state} for
+        the requested services. --value prints one ActiveState per unit,
+        in argument order, blank-line separated. With max_age, services
+        read less than max_age seconds ago are not queried again.
+        """
+        with self._service_lock:
+            stale = services
+            if max_age is not None:
+                now = time.monotonic()
+                stale = [service for service in services
+                         if service not in self._service_state_cache
+                         or now - self._service_state_checked.get(service, 0) > max_age]
+            
+            if stale:
+                result = subprocess.run(
+                    ["systemctl", "show", "--property=ActiveState", "--value", *stale],
+                    capture_output=True,
+                    text=True
+                )
+                states = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+                
+                if len(states) != len(stale):
+                    # Fall back to asking about each service on its own
+                    states = [subprocess.run(["systemctl", "is-active", service],
+                                             capture_output=True, text=True).stdout.strip()
+                              for service in stale]
+                
+                checked_at = time.monotonic()
+                for service, state in zip(stale, states):
+                    self._service_state_cache[service] = state
+                    self._service_state_checked[service] = checked_at
+            
+            return {service: self._service_state_cache[service] for service in services}
+    
+    def _forget_service_state(self, service):
+        """Drop a service's cached state, so the next read queries systemctl."""
+        with self._service_lock:
+            self._service_state_cache.pop(service, None)
+            self._service_state_checked.pop(service, None)
+    
+    def _forget_host_state(self):
+        """Drop every cached service state and host check result.
+        
+        Called after anything that changes the host: removing a package,
+        deleting a user or restoring files can stop services too.
+        """
+        with self._service_lock:
+            self._service_state_cache.clear()
+            self._service_state_checked.clear()
+            self._host_check_cache.clear()
+    
+    def _service_state(self, service):
+        """Return a service's ActiveState, from the cache when still fresh."""
+        return self._refresh_service_states([service], max_age=VALIDATION_CACHE_TTL)[service]
+    
+    def _host_check(self, cmd):
+        """Return the first data line of a host check command's output.
+        
+        The result is reused for VALIDATION_CACHE_TTL seconds.
+        """
+        key = tuple(cmd)
+        cached = self._host_check_cache.get(key)
+        if cached and time.monotonic() - cached[0] <= VALIDATION_CACHE_TTL:
+            return cached[1]
+        
+        result = subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True
+        )
+        lines = result.stdout.split('\n')
+        line = lines[1] if len(lines) > 1 else ""
+        self._host_check_cache[key] = (time.monotonic(), line)
+        return line
+    
     def validate_node(self, node, validation_type="pre_remediation"):
         """Validate node state before/after remediation."""
         try:
@@ -154,14 +454,9 @@ class RemediationEngine:
             
             # Check required services
             required_services = self.config['remediation']['validation']['required_services']
+            service_states = self._refresh_service_states(required_services, max_age=VALIDATION_CACHE_TTL)
             for service in required_services:
-                result = subprocess.run(
-                    ["systemctl", "is-active", service],
-                    capture_output=True,
-                    text=True
-                )
-                
-                is_active = result.stdout.strip() == "active"
+                is_active = service_states[service] == "active"
                 check = {
                     "check": f"service_{service}",
                     "status": "active" if is_active else "inactive",
@@ -173,12 +468,7 @@ class RemediationEngine:
                     validation_results["passed"] = False
             
             # Check disk space
-            result = subprocess.run(
-                ["df", "-h", "/"],
-                capture_output=True,
-                text=True
-            )
-            disk_info = result.stdout.split('\n')[1] if len(result.stdout.split('\n')) > 1 else ""
+            disk_info = self._host_check(["df", "-h", "/"])
             validation_results["checks"].append({
                 "check": "disk_space",
                 "status": disk_info,
@@ -186,12 +476,7 @@ class RemediationEngine:
             })
             
             # Check memory
-            result = subprocess.run(
-                ["free", "-m"],
-                capture_output=True,
-                text=True
-            )
-            memory_info = result.stdout.split('\n')[1] if len(result.stdout.split('\n')) > 1 else ""
+            memory_info = self._host_check(["free", "-m"])
             validation_results["checks"].append({
                 "check": "memory",
                 "status": memory_info,
@@ -202,9 +487,8 @@ class RemediationEngine:
             self.log_event(f"validation_{validation_type}", node, f"Validation {status}")
             
             # Save validation results
-            validation_file = f"{self.remediation_dir}/validation_{validation_type}_{node}.json"
-            with open(validation_file, 'w') as f:
-                json.dump(validation_results, f, indent=2)
+            with self._state_lock:
+                self._validation_buf.setdefault(validation_type, []).append(validation_results)
             
             return validation_results
             
@@ -214,61 +498,118 @@ class RemediationEngine:
     
     def remediate_file_changes(self, node, file_path, previous_checksum):
         """Remediate file changes by restoring from backup or template."""
+        drift = {"file": file_path, "previous_checksum": previous_checksum}
+        return self.remediate_file_changes_bulk(node, [drift])[0]
+    
+    def _is_managed(self, file_path):
+        """Return whether file_path lies inside a managed directory.
+        
+        Walks up the path's ancestors with one set lookup each, so the
+        cost depends on the path's depth, not the number of managed
+        directories.
+        """
+        path = posixpath.normpath(file_path)
+        while True:
+            if path in self._managed_dirs:
+                return True
+            parent = posixpath.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+    
+    def _restore_file_from_backup(self, node, file_path):
+        """Restore one file from the node's backup.
+        
+        Returns True if restored, False if it cannot be remediated, or None
+        when there is no backup and Ansible has to restore it.
+        """
         try:
             # First, check if this is a managed file
-            managed_dirs = ["/var/www", "/etc/nginx", "/etc/apache2", "/etc/httpd", "/etc/ansible-managed"]
-            is_managed = any(file_path.startswith(dir) for dir in managed_dirs)
-            
-            if not is_managed:
+            if not self._is_managed(file_path):
                 self.log_event("skip_remediation", node, f"File not in managed directory: {file_path}", "warning")
                 return False
             
             # Check if we have a backup
             backup_file = f"backups/pre_remediation/{node}_{self.remediation_id}/{file_path.lstrip('/')}"
             if os.path.exists(backup_file):
-                # Restore from backup
-                subprocess.run(["sudo", "cp", backup_file, file_path], check=True)
+                # Restore from backup; as root, copy in-process (sendfile
+                # on Linux) instead of forking sudo and cp
+                if os.geteuid() == 0:
+                    shutil.copyfile(backup_file, file_path)
+                    shutil.copystat(backup_file, file_path)
+                else:
+                    subprocess.run(["sudo", "cp", backup_file, file_path], check=True)
                 self.log_event("file_restored", node, f"Restored {file_path} from backup")
                 return True
             
-            # If no backup, use Ansible to restore desired state
-            ansible_playbook = self.config['integration']['ansible']['playbooks_path'] + "webserver-deploy.yml"
-            inventory = self.config['integration']['ansible']['inventory_path']
+            return None
+            
+        except Exception as e:
+            self.log_event("file_remediation_error", node, str(e), "error")
+            return False
+    
+    def remediate_file_changes_bulk(self, node, drifts):
+        """Remediate all file changes on a node.
+        
+        Files with a backup are restored directly. For the rest, the
+        webserver content play is run once for the node, instead of once
+        per file, and its outcome stands for each of them. Returns one
+        success flag per drift.
+        """
+        results = []
+        pending = []
+        for drift in drifts:
+            restored = self._restore_file_from_backup(node, drift['file'])
+            if restored is None:
+                pending.append(len(results))
+            results.append(bool(restored))
+        
+        if not pending:
+            return results
+        
+        files = [drifts[i]['file'] for i in pending]
+        try:
+            # Use Ansible to restore desired state
+            ansible = self.config['integration']['ansible']
+            ansible_playbook = ansible['playbooks_path'] + "webserver-deploy.yml"
+            inventory = ansible['inventory_path']
             
             result = subprocess.run(
                 ["ansible-playbook", "-i", inventory, ansible_playbook, "--limit", node, "--tags", "content"],
                 capture_output=True,
-                text=True
+                text=True,
+                env=ansible_env(ansible.get('config_path'))
             )
-            
-            if result.returncode == 0:
-                self.log_event("file_remediated", node, f"Restored {file_path} via Ansible")
-                return True
-            else:
-                self.log_event("file_remediation_failed", node, f"Failed to restore {file_path}", "error")
-                return False
-                
+            success = result.returncode == 0
         except Exception as e:
             self.log_event("file_remediation_error", node, str(e), "error")
-            return False
+            return results
+        
+        # The content play enforces the node's whole desired content, not
+        # the listed files one by one, so its outcome is logged once
+        if success:
+            self.log_event("file_remediated", node,
+                           f"Re-applied desired content via Ansible for {len(files)} drifted files: {', '.join(files)}")
+        else:
+            self.log_event("file_remediation_failed", node,
+                           f"Ansible content run failed; {len(files)} drifted files not restored: {', '.join(files)}", "error")
+        for i in pending:
+            results[i] = success
+        
+        return results
     
     def remediate_service_status(self, node, service, desired_status="active"):
         """Remediate service status."""
         try:
             # Check current status
-            result = subprocess.run(
-                ["systemctl", "is-active", service],
-                capture_output=True,
-                text=True
-            )
-            
-            current_status = result.stdout.strip()
+            current_status = self._service_state(service)
             
             if current_status == desired_status:
                 self.log_event("service_already_ok", node, f"Service {service} already {desired_status}")
                 return True
             
-            # Attempt to fix
+            # Attempt to fix; the cached state is stale from here on
+            self._forget_service_state(service)
             if desired_status == "active":
                 subprocess.run(["sudo", "systemctl", "start", service], check=True)
                 subprocess.run(["sudo", "systemctl", "enable", service], check=True)
@@ -280,13 +621,7 @@ class RemediationEngine:
             
             # Verify fix
             time.sleep(2)  # Give service time to start/stop
-            result = subprocess.run(
-                ["systemctl", "is-active", service],
-                capture_output=True,
-                text=True
-            )
-            
-            new_status = result.stdout.strip()
+            new_status = self._service_state(service)
             
             if new_status == desired_status:
                 self.log_event("service_remediated", node, f"Service {service} {action} (now {new_status})")
@@ -301,43 +636,59 @@ class RemediationEngine:
     
     def remediate_unauthorized_package(self, node, package, action="remove"):
         """Remediate unauthorized packages."""
+        return self.remediate_packages_bulk(node, [package], action)[0]
+    
+    def _package_transaction(self, action, packages):
+        """Install or remove packages in one package manager run."""
+        result = subprocess.run(
+            ["sudo", self._pkg_mgr, action, "-y", *packages],
+            capture_output=True,
+            text=True
+        )
+        return result.returncode == 0
+    
+    def remediate_packages_bulk(self, node, packages, action="remove"):
+        """Remove (or install) several packages in a single transaction.
+        
+        Dependency solving and the package database lock are paid once
+        per node instead of once per package. If the transaction fails,
+        each package is retried alone to find the ones at fault. Returns
+        one success flag per package.
+        """
+        if not self._pkg_mgr:
+            self.log_event("package_remediation_error", node,
+                           "No supported package manager (apt-get, dnf or yum) found", "error")
+            return [False] * len(packages)
+        
         try:
-            if action == "remove":
-                # Try different package managers
-                commands = [
-                    ["sudo", "apt", "remove", "-y", package],
-                    ["sudo", "yum", "remove", "-y", package],
-                    ["sudo", "dnf", "remove", "-y", package]
-                ]
-                
-                for cmd in commands:
-                    result = subprocess.run(cmd, capture_output=True, text=True)
-                    if result.returncode == 0:
-                        self.log_event("package_removed", node, f"Removed unauthorized package: {package}")
-                        return True
-                
-                self.log_event("package_removal_failed", node, f"Failed to remove {package}", "warning")
-                return False
-                
-            else:  # action == "install" for missing required packages
-                commands = [
-                    ["sudo", "apt", "install", "-y", package],
-                    ["sudo", "yum", "install", "-y", package],
-                    ["sudo", "dnf", "install", "-y", package]
-                ]
-                
-                for cmd in commands:
-                    result = subprocess.run(cmd, capture_output=True, text=True)
-                    if result.returncode == 0:
-                        self.log_event("package_installed", node, f"Installed required package: {package}")
-                        return True
-                
-                self.log_event("package_install_failed", node, f"Failed to install {package}", "warning")
-                return False
-                
+            names = sorted({package for package in packages if package})
+            succeeded = set()
+            if names:
+                if self._package_transaction(action, names):
+                    succeeded = set(names)
+                elif len(names) > 1:
+                    # One bad package fails the whole transaction
+                    succeeded = {name for name in names if self._package_transaction(action, [name])}
         except Exception as e:
             self.log_event("package_remediation_error", node, str(e), "error")
-            return False
+            return [False] * len(packages)
+        
+        results = []
+        for package in packages:
+            success = package in succeeded
+            if action == "remove":
+                if success:
+                    self.log_event("package_removed", node, f"Removed unauthorized package: {package}")
+                else:
+                    self.log_event("package_removal_failed", node, f"Failed to remove {package}", "warning")
+            else:
+                if success:
+                    self.log_event("package_installed", node, f"Installed required package: {package}")
+                else:
+                    self.log_event("package_install_failed", node, f"Failed to install {package}", "warning")
+            results.append(success)
+        
+        return results
     
     def remediate_unauthorized_user(self, node, username, action="remove"):
         """Remediate unauthorized users."""
@@ -369,6 +720,20 @@ class RemediationEngine:
             self.log_event("user_remediation_error", node, str(e), "error")
             return False
     
+    def _remediate_service_drift(self, node, drift):
+        desired_status = 'active'  # Default desired state
+        return self.remediate_service_status(node, drift.get('service', ''), desired_status)
+    
+    def _remediate_user_drift(self, node, drift):
+        action = 'remove' if drift['type'] == 'user_added' else 'add'
+        return self.remediate_unauthorized_user(node, drift.get('user', ''), action)
+    
+    def _remediate_package_drifts(self, node, drifts):
+        # Called with drifts of a single type
+        action = 'remove' if drifts[0]['type'] == 'package_added' else 'install'
+        packages = [drift.get('package', '') for drift in drifts]
+        return self.remediate_packages_bulk(node, packages, action)
+    
     def remediate_node(self, node, drifts):
         """Remediate all drifts on a single node."""
         logger.info(f"Starting remediation on node: {node}")
@@ -389,38 +754,47 @@ class RemediationEngine:
         
         remediation_results = []
         
-        # Process each drift
+        # Drifts of kinds remediated in bulk are grouped by type; the rest
+        # keep their report order
+        bulk_drifts = {}
+        single_drifts = []
+        
         for drift in drifts:
-            success = False
-            
-            if drift['type'] == 'file_change':
-                success = self.remediate_file_changes(node, drift['file'], drift.get('previous_checksum'))
-            
-            elif drift['type'] == 'service_status_change':
-                service = drift.get('service', '')
-                desired_status = 'active'  # Default desired state
-                success = self.remediate_service_status(node, service, desired_status)
-            
-            elif drift['type'] in ['package_added', 'package_removed']:
-                package = drift.get('package', '')
-                action = 'remove' if drift['type'] == 'package_added' else 'install'
-                success = self.remediate_unauthorized_package(node, package, action)
-            
-            elif drift['type'] in ['user_added', 'user_removed']:
-                username = drift.get('user', '')
-                action = 'remove' if drift['type'] == 'user_added' else 'add'
-                success = self.remediate_unauthorized_user(node, username, action)
+            drift_type = drift['type']
             
+            if drift_type in self._bulk_handlers:
+                bulk_drifts.setdefault(drift_type, []).append(drift)
+            elif drift_type in self._handlers:
+                single_drifts.append(drift)
             else:
-                self.log_event("unknown_drift_type", node, f"Unknown drift type: {drift['type']}", "warning")
+                self.log_event("unknown_drift_type", node, f"Unknown drift type: {drift_type}", "warning")
+        
+        # Files and packages first, so a service is only started once its
+        # configuration and package are back in place
+        for drift_type, bulk_handler in self._bulk_handlers.items():
+            type_drifts = bulk_drifts.get(drift_type)
+            if not type_drifts:
                 continue
-            
+            for drift, success in zip(type_drifts, bulk_handler(node, type_drifts)):
+                remediation_results.append({
+                    "drift": drift,
+                    "success": success,
+                    "timestamp": datetime.now().isoformat()
+                })
+        
+        # Process each remaining drift
+        for drift in single_drifts:
             remediation_results.append({
                 "drift": drift,
-                "success": success,
+                "success": self._handlers[drift['type']](node, drift),
                 "timestamp": datetime.now().isoformat()
             })
         
+        # Whatever was remediated may have changed service states, so
+        # validate against fresh readings
+        if remediation_results:
+            self._forget_host_state()
+        
         # Post-remediation validation
         if self.config['remediation']['validation']['post_remediation_validation']:
             validation = self.validate_node(node, "post_remediation")
@@ -434,19 +808,21 @@ class RemediationEngine:
         
         # Save results
         results_file = f"{self.remediation_dir}/remediation_{node}.json"
-        with open(results_file, 'w') as f:
-            json.dump(remediation_results, f, indent=2)
+        with open(results_file, 'wb') as f:
+            f.write(json_dumps_indented(remediation_results))
         
         success_count = sum(1 for r in remediation_results if r['success'])
         total_count = len(remediation_results)
         
         if success_count == total_count:
             self.log_event("remediation_complete", node, f"All {total_count} drifts remediated successfully")
-            self.remediated_nodes.append(node)
+            with self._state_lock:
+                self.remediated_nodes.append(node)
             return True
         else:
             self.log_event("remediation_partial", node, f"{success_count}/{total_count} drifts remediated", "warning")
-            self.remediated_nodes.append(node)  # Still consider partially successful
+            with self._state_lock:
+                self.remediated_nodes.append(node)  # Still consider partially successful
             return success_count > 0  # Return True if at least one drift was fixed
     
     def rollback_node(self, node):
@@ -460,26 +836,67 @@ class RemediationEngine:
                 self.log_event("rollback_failed", node, "Backup directory not found", "error")
                 return False
             
-            # Restore files from backup
-            for root, dirs, files in os.walk(backup_dir):
-                for file in files:
-                    backup_file = os.path.join(root, file)
-                    # Convert backup path to system path
-                    system_path = '/' + os.path.relpath(backup_file, backup_dir)
-                    
-                    # Ensure parent directory exists
-                    os.makedirs(os.path.dirname(system_path), exist_ok=True)
-                    
-                    # Copy file back
-                    shutil.copy2(backup_file, system_path)
+            # Restore the backed-up trees (not the service status snapshot)
+            trees = [path for path in BACKUP_PATHS
+                     if os.path.isdir(os.path.join(backup_dir, path.lstrip('/')))]
+            
+            if RSYNC:
+                # One rsync for every tree; "/./" marks where the restored
+                # path starts, and parent directories like /etc are left alone
+                if trees:
+                    subprocess.run(
+                        [RSYNC, "-a", "--relative", "--no-implied-dirs",
+                         *(f"{backup_dir}/.{path}" for path in trees), "/"],
+                        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+                    )
+            else:
+                for path in trees:
+                    for root, dirs, files in os.walk(os.path.join(backup_dir, path.lstrip('/'))):
+                        for file in files:
+                            backup_file = os.path.join(root, file)
+                            # Convert backup path to system path
+                            system_path = '/' + os.path.relpath(backup_file, backup_dir)
+                            
+                            # Ensure parent directory exists
+                            os.makedirs(os.path.dirname(system_path), exist_ok=True)
+                            
+                            # Copy file back
+                            shutil.copy2(backup_file, system_path)
             
+            self._forget_host_state()
             self.log_event("rollback_complete", node, f"Rolled back to pre-remediation state")
             return True
             
+        except subprocess.CalledProcessError as e:
+            self.log_event("rollback_error", node, f"{str(e)} {(e.stderr or '').strip()}", "error")
+            return False
         except Exception as e:
             self.log_event("rollback_error", node, str(e), "error")
             return False
     
+    def remediate_nodes(self, nodes_with_drifts):
+        """Remediate several nodes concurrently.
+        
+        Up to max_concurrent_remediations nodes run at once. Remediation
+        commands run on this host, so the default of 1 keeps nodes from
+        changing the same system (and package database) at the same
+        time. Returns a list of (node, success) in completion order.
+        """
+        max_workers = max(1, self.config['remediation'].get('max_concurrent_remediations', 1))
+        
+        results = []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(nodes_with_drifts) or 1)) as executor:
+            futures = {executor.submit(self.remediate_node, node, drifts): node
+                       for node, drifts in nodes_with_drifts.items()}
+            for future in as_completed(futures):
+                results.append((futures[future], future.result()))
+        
+        return results
+    
+    def skip_canary_wait(self):
+        """End the wait between canary and full remediation now."""
+        self._skip_wait.set()
+    
     def run_canary_remediation(self, nodes_with_drifts):
         """Run canary remediation phase."""
         if not nodes_with_drifts:
@@ -491,7 +908,7 @@ class RemediationEngine:
         
         logger.info(f"Starting canary remediation on {len(self.canary_nodes)} nodes")
         
-        canary_results = []
+        canary_drifts = {}
         for node in self.canary_nodes:
             drifts = nodes_with_drifts.get(node, [])
             
@@ -499,9 +916,10 @@ class RemediationEngine:
                 self.log_event("no_drifts", node, "No drifts to remediate")
                 continue
             
-            # Remediate node
-            success = self.remediate_node(node, drifts)
-            canary_results.append((node, success))
+            canary_drifts[node] = drifts
+        
+        # Remediate canary nodes
+        canary_results = self.remediate_nodes(canary_drifts)
         
         # Calculate success rate
         successful_canaries = sum(1 for _, success in canary_results if success)
@@ -531,14 +949,27 @@ class RemediationEngine:
         
         logger.info(f"Starting full remediation on {len(remaining_nodes)} nodes")
         
-        for node, drifts in remaining_nodes.items():
-            self.remediate_node(node, drifts)
+        self.remediate_nodes(remaining_nodes)
         
         logger.info("Full remediation complete")
         return True
     
+    def write_validation_results(self):
+        """Write each validation type's results, for all nodes, to one file."""
+        with self._state_lock:
+            buffered = {validation_type: list(results)
+                        for validation_type, results in self._validation_buf.items()}
+        
+        for validation_type, results in buffered.items():
+            validation_file = f"{self.remediation_dir}/validation_{validation_type}.json"
+            with open(validation_file, 'wb') as f:
+                f.write(json_dumps_indented(results))
+    
     def generate_remediation_report(self):
         """Generate comprehensive remediation report."""
+        with self._event_lock:
+            events_by_type = dict(self._event_counts)
+        
         report = {
             "metadata": {
                 "remediation_id": self.remediation_id,
@@ -553,15 +984,10 @@ class RemediationEngine:
                 "remediated_nodes": self.remediated_nodes,
                 "failed_nodes": self.failed_nodes
             },
-            "events_by_type": {},
+            "events_by_type": events_by_type,
             "recommendations": []
         }
         
-        # Count events by type
-        for event in self.remediation_log:
-            event_type = event['type']
-            report["events_by_type"][event_type] = report["events_by_type"].get(event_type, 0) + 1
-        
         # Calculate duration
         if self.remediation_log:
             start_time = datetime.fromisoformat(report["metadata"]["start_time"].replace('Z', '+00:00'))
@@ -583,10 +1009,15 @@ class RemediationEngine:
                 "details": "Consider adjusting validation thresholds or improving remediation scripts"
             })
         
+        # Make every event and validation result so far visible
+        # alongside the report
+        self.flush_events()
+        self.write_validation_results()
+        
         # Save report
         report_file = f"{self.remediation_dir}/remediation_report.json"
-        with open(report_file, 'w') as f:
-            json.dump(report, f, indent=2)
+        with open(report_file, 'wb') as f:
+            f.write(json_dumps_indented(report))
         
         # Generate markdown summary
         markdown_file = f"{self.remediation_dir}/README.md"
@@ -610,7 +1041,7 @@ class RemediationEngine:
             f.write("\n## Log Files\n\n")
             f.write("- `events.json` - All remediation events\n")
             f.write("- `remediation_*.json` - Per-node remediation results\n")
-            f.write("- `validation_*.json` - Pre/post validation results\n")
+            f.write("- `validation_*.json` - Pre/post validation results for all nodes\n")
         
         logger.info(f"Remediation report generated: {report_file}")
         return report
@@ -625,18 +1056,19 @@ class RemediationEngine:
             return False
         
         # Load detection data
-        if not self.detection_report:
+        if not self.detection_report_path:
             logger.error("No detection report available")
             return False
         
         # Extract drifts by node
-        nodes_with_drifts = {}
-        for detection in self.detection_report.get('detections', []):
-            # Assuming detection has node information
-            node = detection.get('node', 'unknown')
-            if node not in nodes_with_drifts:
-                nodes_with_drifts[node] = []
-            nodes_with_drifts[node].append(detection)
+        nodes_with_drifts = defaultdict(list)
+        try:
+            for detection in self.iter_detections():
+                # Assuming detection has node information
+                nodes_with_drifts[detection.get('node', 'unknown')].append(detection)
+        except Exception as e:
+            logger.error(f"Failed to load detection report: {str(e)}")
+            return False
         
         if not nodes_with_drifts:
             logger.info("No drifts detected in the report")
@@ -655,8 +1087,9 @@ class RemediationEngine:
         # Wait before full rollout (if configured)
         wait_time = self.config['remediation']['canary']['wait_time_minutes']
         if wait_time > 0 and self.canary_nodes:
-            logger.info(f"Waiting {wait_time} minutes before full rollout...")
-            time.sleep(wait_time * 60)
+            logger.info(f"Waiting {wait_time} minutes before full rollout (SIGUSR1 skips the wait)...")
+            if self._skip_wait.wait(timeout=wait_time * 60):
+                logger.info("Canary wait skipped, starting full rollout")
         
         # Run full remediation
         self.run_full_remediation(nodes_with_drifts)
@@ -687,6 +1120,9 @@ def main():
     
     engine = RemediationEngine(config_path)
     
+    # Let operators cut the canary wait short with `kill -USR1 <pid>`
+    signal.signal(signal.SIGUSR1, lambda signum, frame: engine.skip_canary_wait())
+    
     if args.safe_mode:
         print("Running in SAFE MODE - no actual changes will be made")
         engine.config['remediation']['safe_mode'] = True
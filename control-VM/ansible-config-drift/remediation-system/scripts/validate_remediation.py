@@ -4,43 +4,103 @@ Validate remediation results.
 """
 
 import os
+import mmap
 import json
+import functools
 from datetime import datetime, timedelta
 
+# Report markers, in scan_report()'s result order
+MARKERS = (b"Canary Phase: SUCCESS", b"Full Remediation: COMPLETED", b"CRITICAL:")
+
+def scan_report(report_path):
+    """Scan a consolidated report for its status markers.
+    
+    Returns (canary_ok, full_ok, critical_seen). The report is memory
+    mapped and each marker searched for in place, so no copy of it is
+    made and each search stops at its first match; only the pages a
+    search actually reaches are read.
+    """
+    with open(report_path, 'rb') as f:
+        # An empty file cannot be mapped, and holds no markers anyway
+        if os.fstat(f.fileno()).st_size == 0:
+            return (False,) * len(MARKERS)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return tuple(mm.find(marker) != -1 for marker in MARKERS)
+
+# Directory identity and mtime at the last scan, and the (name, path) of
+# its newest run; adding or removing a run changes the directory's mtime
+_LATEST_RUN = {"key": None, "run": None}
+
+def find_latest_run(reports_dir, st):
+    """Return (name, path) of the newest remediation_* directory, or None.
+    
+    st is reports_dir's stat result; the directory is only listed again
+    when it has changed since the previous call.
+    """
+    key = (reports_dir, st.st_dev, st.st_ino, st.st_mtime_ns)
+    if _LATEST_RUN["key"] == key:
+        return _LATEST_RUN["run"]
+    
+    # Run names are timestamped, so the newest sorts last. Only entries
+    # that would become the new maximum are checked to be directories;
+    # DirEntry.is_dir() uses the type returned with the listing anyway
+    latest = None
+    latest_name = ""
+    with os.scandir(reports_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            if (name > latest_name and name.startswith('remediation_')
+                    and entry.is_dir(follow_symlinks=False)):
+                latest = entry
+                latest_name = name
+    
+    _LATEST_RUN["key"] = key
+    _LATEST_RUN["run"] = (latest.name, latest.path) if latest else None
+    return _LATEST_RUN["run"]
+
+@functools.lru_cache(maxsize=128)
+def _scan_report_cached(report_path, mtime_ns, size):
+    """scan_report() memoized; mtime and size in the key drop stale results."""
+    return scan_report(report_path)
+
 def validate_remediation():
     """Validate that remediation was successful."""
     reports_dir = "reports"
     
-    if not os.path.exists(reports_dir):
+    try:
+        st = os.stat(reports_dir)
+    except FileNotFoundError:
         print("No reports directory found")
         return False
     
     # Find latest remediation report
-    remediation_dirs = [d for d in os.listdir(reports_dir) if d.startswith('remediation_')]
-    if not remediation_dirs:
+    latest = find_latest_run(reports_dir, st)
+    if latest is None:
         print("No remediation reports found")
         return False
     
-    latest_dir = max(remediation_dirs)
-    report_path = os.path.join(reports_dir, latest_dir, "consolidated_report.md")
+    latest_name, latest_path = latest
+    report_path = os.path.join(latest_path, "consolidated_report.md")
     
-    if not os.path.exists(report_path):
-        print(f"No consolidated report in {latest_dir}")
+    try:
+        st = os.stat(report_path)
+    except FileNotFoundError:
+        print(f"No consolidated report in {latest_name}")
         return False
     
-    # Read and analyze report
-    with open(report_path, 'r') as f:
-        content = f.read()
+    # Read and analyze report, unless this version was already scanned
+    canary_found, full_found, critical_found = _scan_report_cached(
+        report_path, st.st_mtime_ns, st.st_size)
     
     # Simple validation
-    if "Canary Phase: SUCCESS" in content:
+    if canary_found:
         print("✓ Canary phase successful")
         canary_ok = True
     else:
         print("✗ Canary phase failed")
         canary_ok = False
     
-    if "Full Remediation: COMPLETED" in content:
+    if full_found:
         print("✓ Full remediation completed")
         full_ok = True
     else:
@@ -48,7 +108,7 @@ def validate_remediation():
         full_ok = False
     
     # Check for critical alerts
-    if "CRITICAL:" in content:
+    if critical_found:
         print("✗ Critical issues found in report")
         critical_ok = False
     else:
@@ -7,7 +7,8 @@ echo ""
 echo "1. Checking Python dependencies..."
 cd ~/ansible-config-drift/detection-system
 source venv/bin/activate
-python3 -c "import flask, yaml, jsondiff; print('✓ All dependencies installed')"
+python3 -c "import flask, yaml; print('✓ All dependencies installed')"
+python3 -c "import gunicorn" 2>/dev/null && echo "✓ gunicorn installed" || echo "⚠ gunicorn not installed; report-api.service will use the Flask development server (pip install gunicorn)"
 
 echo ""
 echo "2. Testing drift detector..."